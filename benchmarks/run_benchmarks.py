@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+# Measures the overhead of the interestingness tests and the helper script
+# with stub tools (stub_tool.py) instead of Clang, Oclgrind, cl_launcher and
+# CLSmith. Only requires Python and a POSIX system.
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "scripts"))
+
+import interestingness_tests
+import work_size_reduction
+from interestingness_tests import runner
+
+STUB_TOOLS = ["clang", "oclgrind", "cl_launcher", "CLSmith"]
+
+def create_stub_dir(work_dir):
+    bin_dir = os.path.join(work_dir, "bin")
+    os.makedirs(bin_dir)
+
+    for tool in STUB_TOOLS:
+        os.symlink(os.path.join(BENCHMARK_DIR, "stub_tool.py"), os.path.join(bin_dir, tool))
+
+    include_dir = os.path.join(work_dir, "include")
+    os.makedirs(include_dir)
+
+    for header in ["CLSmith.h", "safe_math_macros.h", "cl_safe_math_macros.h"]:
+        open(os.path.join(include_dir, header), "w").close()
+
+    return (bin_dir, include_dir)
+
+def get_environment(args, bin_dir, include_dir):
+    env = os.environ.copy()
+    env["PATH"] = bin_dir + os.pathsep + env.get("PATH", "")
+    env["PYTHONPATH"] = ROOT_DIR
+    env["CLSMITH_INCLUDE_PATH"] = include_dir
+    env["CREDUCE_TEST_CLANG"] = os.path.join(bin_dir, "clang")
+    env["CREDUCE_TEST_CL_LAUNCHER"] = os.path.join(bin_dir, "cl_launcher")
+    env["CREDUCE_TEST_PLATFORM"] = "0"
+    env["CREDUCE_TEST_DEVICE"] = "0"
+    env["CREDUCE_TEST_TIMEOUT"] = str(args.timeout)
+    env["BENCH_SEED"] = str(args.seed)
+    env["BENCH_BUG_RATE"] = str(args.bug_rate)
+
+    for tool in ["CLANG", "OCLGRIND", "CL_LAUNCHER", "CLSMITH"]:
+        env["BENCH_{}_LATENCY".format(tool)] = str(args.latency)
+        env["BENCH_{}_FAILURE_RATE".format(tool)] = str(args.failure_rate)
+        env["BENCH_{}_TIMEOUT_RATE".format(tool)] = str(args.timeout_rate)
+
+    return env
+
+def generate_test_cases(num, work_dir, env):
+    test_cases = []
+
+    for i in range(0, num):
+        scratch_dir = tempfile.mkdtemp(dir=work_dir)
+        subprocess.run(["CLSmith"], cwd=scratch_dir, env=dict(env, BENCH_CLSMITH_FAILURE_RATE="0", BENCH_CLSMITH_TIMEOUT_RATE="0"), check=True)
+        test_case = os.path.join(work_dir, "CLProg_{}.cl".format(i))
+        shutil.move(os.path.join(scratch_dir, "CLProg.c"), test_case)
+        shutil.rmtree(scratch_dir)
+        test_cases.append(test_case)
+
+    return test_cases
+
+def benchmark_spawn(args, env):
+    # Cost of starting a tool through the runner, once for a native no-op and
+    # once for a stub (which includes the interpreter startup)
+    results = dict()
+
+    for (name, cmd) in [("true", ["true"]), ("stub", ["clang", "-E", "-o", os.devnull, os.devnull])]:
+        tool_runner = runner.Runner()
+        start = time.monotonic()
+
+        for _ in range(0, args.spawns):
+            tool_runner.run([shutil.which(cmd[0], path=env["PATH"])] + cmd[1:], args.timeout)
+
+        results[name] = (time.monotonic() - start) / args.spawns
+
+    return {"spawn_true_ms" : results["true"] * 1000, "spawn_stub_ms" : results["stub"] * 1000}
+
+def benchmark_check(args, env, test_cases, jobs):
+    options = interestingness_tests.WrongCodeBugOpenCLInterestingnessTest.get_test_options(env)
+    options["jobs"] = jobs
+    outcomes = dict()
+    start = time.monotonic()
+
+    for i in range(0, args.checks):
+        test = interestingness_tests.WrongCodeBugOpenCLInterestingnessTest([test_cases[i % len(test_cases)]], options)
+
+        try:
+            outcome = "interesting" if test.check() else "not interesting"
+        except interestingness_tests.TestTimeoutError:
+            outcome = "timeout"
+        except interestingness_tests.InvalidTestCaseError:
+            outcome = "invalid"
+
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    duration = time.monotonic() - start
+
+    return {"checks" : args.checks, "checks_per_second" : args.checks / duration, "outcomes" : outcomes}
+
+def benchmark_work_sizes(args, env, test_cases, jobs):
+    options = interestingness_tests.WrongCodeBugOpenCLInterestingnessTest.get_test_options(env)
+    checks = 0
+    start = time.monotonic()
+
+    for test_case in test_cases[:args.work_size_test_cases]:
+        path = test_case + ".rws.cl"
+        shutil.copy(test_case, path)
+        test = interestingness_tests.WrongCodeBugOpenCLInterestingnessTest([path], options)
+        reducer = work_size_reduction.WorkSizeReducer(path, test, jobs=jobs)
+        reducer.run(checked=True)
+        checks += len(reducer.verdicts)
+        del reducer
+
+    duration = time.monotonic() - start
+    num = min(len(test_cases), args.work_size_test_cases)
+
+    return {"test_cases" : num, "seconds_per_test_case" : duration / num, "checks_per_test_case" : checks / num}
+
+def benchmark_pipeline(args, env, work_dir):
+    output_dir = os.path.join(work_dir, "pipeline")
+    cmd = [sys.executable, os.path.join(ROOT_DIR, "scripts", "reduction_helper.py")]
+    cmd.extend(["--generate", str(args.pipeline_test_cases), "--preprocess", "--reduce-work-sizes-checked", "--check"])
+    cmd.extend(["--test", "wrong-code-bug", "--output", output_dir, "--jobs", str(args.jobs), "-n", "1"])
+
+    start = time.monotonic()
+    proc = subprocess.run(cmd, cwd=work_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    duration = time.monotonic() - start
+
+    if proc.returncode != 0:
+        print(proc.stdout)
+        raise RuntimeError("Pipeline failed")
+
+    completed = proc.stdout.count("-> done")
+
+    return {"test_cases" : args.pipeline_test_cases, "interesting" : completed, "test_cases_per_second" : args.pipeline_test_cases / duration}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the interestingness tests and the reduction helper with stub tools.")
+    parser.add_argument("--suites", nargs="+", choices=["spawn", "check", "work-sizes", "pipeline"], default=["spawn", "check", "work-sizes", "pipeline"], help="Benchmarks to run")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latency of every stub tool in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of test cases for which a tool fails")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction of test cases for which a tool hangs")
+    parser.add_argument("--bug-rate", type=float, default=1.0, help="Fraction of test cases with a wrong-code bug")
+    parser.add_argument("--timeout", type=int, default=2, help="Timeout of the tools in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the stub tools")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="Parallel jobs for the parallel variants")
+    parser.add_argument("--spawns", type=int, default=100, help="Number of tool starts of the spawn benchmark")
+    parser.add_argument("--checks", type=int, default=50, help="Number of interestingness tests of the check benchmark")
+    parser.add_argument("--work-size-test-cases", type=int, default=5, help="Number of test cases of the work size benchmark")
+    parser.add_argument("--pipeline-test-cases", type=int, default=20, help="Number of test cases of the pipeline benchmark")
+    parser.add_argument("--json", help="Write the results to a JSON file")
+
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="clreduce_bench.")
+    orig_dir = os.getcwd()
+
+    try:
+        (bin_dir, include_dir) = create_stub_dir(work_dir)
+        env = get_environment(args, bin_dir, include_dir)
+
+        # The interestingness tests run in this process look up oclgrind in
+        # the PATH and the test cases relative to the working directory
+        os.environ["PATH"] = env["PATH"]
+        os.environ.update({k : v for (k, v) in env.items() if k.startswith("BENCH_")})
+        os.chdir(work_dir)
+
+        test_cases = generate_test_cases(max(args.work_size_test_cases, 10), work_dir, env)
+        results = dict()
+
+        if "spawn" in args.suites:
+            results["spawn"] = benchmark_spawn(args, env)
+
+        if "check" in args.suites:
+            results["check"] = benchmark_check(args, env, test_cases, 1)
+            results["check_parallel"] = benchmark_check(args, env, test_cases, args.jobs)
+
+        if "work-sizes" in args.suites:
+            env["BENCH_BUG_MIN_WORK_ITEMS"] = "37"
+            os.environ["BENCH_BUG_MIN_WORK_ITEMS"] = "37"
+            results["work_sizes"] = benchmark_work_sizes(args, env, test_cases, 1)
+            results["work_sizes_parallel"] = benchmark_work_sizes(args, env, test_cases, args.jobs)
+            del env["BENCH_BUG_MIN_WORK_ITEMS"]
+            del os.environ["BENCH_BUG_MIN_WORK_ITEMS"]
+
+        if "pipeline" in args.suites:
+            results["pipeline"] = benchmark_pipeline(args, env, work_dir)
+
+        for (suite, values) in results.items():
+            print("{}:".format(suite))
+
+            for (name, value) in values.items():
+                print("    {:<24} {}".format(name, round(value, 3) if isinstance(value, float) else value))
+
+        if args.json:
+            with open(os.path.join(orig_dir, args.json), "w") as json_file:
+                json.dump(results, json_file, indent=4, sort_keys=True)
+    finally:
+        os.chdir(orig_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
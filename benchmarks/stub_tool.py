@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+# Stand-in for clang, oclgrind, cl_launcher and CLSmith. The tool is selected
+# by the name under which the script is invoked (see run_benchmarks.py which
+# creates the links). All outputs are derived from the content of the test
+# case and BENCH_SEED so that repeated runs behave identically.
+#
+# Environment (TOOL is CLANG, OCLGRIND, CL_LAUNCHER or CLSMITH):
+#   BENCH_<TOOL>_LATENCY       seconds to sleep before producing the output
+#   BENCH_<TOOL>_FAILURE_RATE  fraction of test cases for which the tool fails
+#   BENCH_<TOOL>_TIMEOUT_RATE  fraction of test cases for which the tool hangs
+#   BENCH_BUG_RATE             fraction of test cases with a wrong-code bug
+#   BENCH_BUG_MIN_WORK_ITEMS   minimum number of work items to expose the bug
+#   BENCH_GLOBAL_WORK_SIZE     global work size of generated test cases
+#   BENCH_LOCAL_WORK_SIZE      local work size of generated test cases
+#   BENCH_SEED                 seed of all decisions
+
+import hashlib
+import os
+import re
+import sys
+import time
+
+def get_fraction(*keys):
+    digest = hashlib.sha256(":".join([os.environ.get("BENCH_SEED", "0")] + list(keys)).encode()).digest()
+    return int.from_bytes(digest[:8], "big") / 2**64
+
+def get_float(name, default=0.0):
+    return float(os.environ.get(name, default))
+
+def simulate(tool, key):
+    # Latency, hangs and failures of the tool
+    prefix = "BENCH_{}_".format(tool.upper())
+
+    time.sleep(get_float(prefix + "LATENCY"))
+
+    if get_fraction(tool, "timeout", key) < get_float(prefix + "TIMEOUT_RATE"):
+        time.sleep(3600)
+
+    if get_fraction(tool, "failure", key) < get_float(prefix + "FAILURE_RATE"):
+        print("{}: simulated failure".format(tool), file=sys.stderr)
+        sys.exit(1)
+
+def read_test_case(argv):
+    path = argv[argv.index("-f") + 1] if "-f" in argv else argv[-1]
+
+    with open(path, "r") as test_file:
+        return test_file.read()
+
+def get_work_items(content):
+    m = re.match(r"//.* -g ([0-9]+),([0-9]+),([0-9]+) -l", content)
+
+    if m is None:
+        return 0
+
+    return int(m.group(1)) * int(m.group(2)) * int(m.group(3))
+
+def get_result(content):
+    # Only the kernel body matters for the result, not the work sizes
+    body = content.split("\n", 1)[-1]
+    return "0x{}".format(hashlib.sha256(body.encode()).hexdigest()[:16])
+
+def run_clang(argv):
+    if "-E" in argv:
+        content = read_test_case(argv)
+        simulate("clang", content)
+
+        # Preprocessing only drops the includes
+        with open(argv[argv.index("-o") + 1], "w") as output:
+            output.write("".join(line for line in content.splitlines(True) if not line.startswith("#include")))
+    else:
+        content = read_test_case(argv)
+        simulate("clang", content + " ".join(argv))
+
+def run_oclgrind(argv):
+    content = read_test_case(argv)
+    simulate("oclgrind", content + str("---disable_opts" in argv))
+    print(get_result(content))
+
+def run_cl_launcher(argv):
+    content = read_test_case(argv)
+    simulate("cl_launcher", content + str("---disable_opts" in argv))
+    result = get_result(content)
+
+    # Only the optimised run is miscompiled
+    if ("---disable_opts" not in argv and
+        get_fraction("bug", content.split("\n", 1)[-1]) < get_float("BENCH_BUG_RATE", 1.0) and
+        get_work_items(content) >= get_float("BENCH_BUG_MIN_WORK_ITEMS", 1)):
+        result = result[:-1] + ("0" if result[-1] != "0" else "1")
+
+    print(result)
+
+def run_cl_smith(argv):
+    seed = int(get_fraction("clsmith", os.getcwd(), str(time.monotonic())) * 2**31)
+    simulate("clsmith", str(seed))
+
+    global_work_size = os.environ.get("BENCH_GLOBAL_WORK_SIZE", "64,8,1")
+    local_work_size = os.environ.get("BENCH_LOCAL_WORK_SIZE", "8,2,1")
+
+    with open("CLProg.c", "w") as output:
+        output.write("// -g {} -l {}\n".format(global_work_size, local_work_size))
+        output.write("#include \"CLSmith.h\"\n")
+        output.write("size_t get_linear_global_id(void) {\n")
+        output.write("    return (get_global_id(2) * get_global_size(1) + get_global_id(1)) * get_global_size(0) + get_global_id(0);\n")
+        output.write("}\n\n")
+        output.write("kernel void entry(global ulong *result) {\n")
+
+        for i in range(0, 1 + seed % 16):
+            output.write("    ulong v{0} = {1}UL * {0}UL;\n".format(i, seed))
+
+        output.write("    result[get_linear_global_id()] = v0;\n")
+        output.write("}\n")
+
+if __name__ == "__main__":
+    tools = {"clang" : run_clang,
+             "oclgrind" : run_oclgrind,
+             "cl_launcher" : run_cl_launcher,
+             "CLSmith" : run_cl_smith}
+
+    tool = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+
+    if tool not in tools:
+        print("Unknown stub tool '{}'".format(tool))
+        sys.exit(1)
+
+    tools[tool](sys.argv[1:])
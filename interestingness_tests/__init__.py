@@ -1,3 +1,4 @@
 from .base import TestTimeoutError
 from .base import InvalidTestCaseError
+from .testcase import TestCase
 from .wrong_code_bug import WrongCodeBugOpenCLInterestingnessTest
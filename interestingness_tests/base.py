@@ -1,5 +1,14 @@
 import sys
 import enum
+import concurrent.futures
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from interestingness_tests import telemetry
+from interestingness_tests import testcase
 
 class InvalidTestCaseError(Exception):
     pass
@@ -7,27 +16,587 @@ class InvalidTestCaseError(Exception):
 class TestTimeoutError(Exception):
     pass
 
+class PendingResultError(Exception):
+    pass
+
+class Rejection:
+    # Result of a failed validity check which behaves like False but records
+    # the reason of the failure
+    def __init__(self, reason):
+        self.reason = reason
+
+    def __bool__(self):
+        return False
+
+    def __str__(self):
+        return str(self.reason)
+
+class SequentialEvaluator:
+    # Runs the submitted tasks lazily one after another when their result is
+    # requested by the decision function
+    def __init__(self):
+        self.tasks = dict()
+        self.results = dict()
+        self.durations = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _timed(self, name, fn, *args, **kwargs):
+        start = time.monotonic()
+
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.durations[name] = time.monotonic() - start
+
+    def submit(self, name, fn, *args, **kwargs):
+        self.tasks[name] = (fn, args, kwargs)
+
+    def is_done(self, name):
+        return name in self.results
+
+    def get_duration(self, name):
+        return self.durations.get(name)
+
+    def get(self, name):
+        if name not in self.results:
+            (fn, args, kwargs) = self.tasks[name]
+
+            try:
+                self.results[name] = (self._timed(name, fn, *args, **kwargs), None)
+            except Exception as err:
+                self.results[name] = (None, err)
+
+        (result, err) = self.results[name]
+
+        if err is not None:
+            raise err
+
+        return result
+
+    def evaluate(self, decide):
+        return decide(self)
+
+    def wait(self, names):
+        # Runs the given tasks even if the decision did not need them
+        for name in names:
+            try:
+                self.get(name)
+            except Exception:
+                pass
+
+    def close(self):
+        pass
+
+class ConcurrentEvaluator(SequentialEvaluator):
+    # Runs all submitted tasks concurrently and reevaluates the decision
+    # function whenever a task finishes. As soon as the decision function
+    # does not depend on any pending task anymore the remaining tasks are
+    # cancelled.
+    def __init__(self, jobs, cancel=None):
+        super().__init__()
+        self.executor = concurrent.futures.ThreadPoolExecutor(jobs)
+        self.futures = dict()
+        self.cancel = cancel
+
+    def submit(self, name, fn, *args, **kwargs):
+        self.futures[name] = self.executor.submit(self._timed, name, fn, *args, **kwargs)
+
+    def is_done(self, name):
+        future = self.futures[name]
+
+        return future.done() and not future.cancelled()
+
+    def get(self, name):
+        future = self.futures[name]
+
+        if not future.done():
+            raise PendingResultError(name)
+
+        return future.result()
+
+    def evaluate(self, decide):
+        pending = set(self.futures.values())
+
+        while True:
+            try:
+                return decide(self)
+            except PendingResultError:
+                pending = {f for f in pending if not f.done()}
+
+                if not pending:
+                    raise
+
+                concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+    def wait(self, names):
+        concurrent.futures.wait([self.futures[name] for name in names])
+
+    def close(self):
+        for future in self.futures.values():
+            future.cancel()
+
+        if self.cancel is not None:
+            self.cancel()
+
+        self.executor.shutdown(wait=True)
+
+class Stage:
+    # Independent validity check of a test case which consists of one or more
+    # tasks. The validate function decides based on the results of the tasks
+    # whether the test case passes the stage.
+    def __init__(self, name, validate=None):
+        self.name = name
+        self.tasks = []
+        self.passed = None
+        self.reason = None
+        self._validate = validate
+
+    def validate(self, results):
+        if self._validate is not None:
+            return self._validate(results)
+
+        return results.get(self.name)
+
+    def add_task(self, name, fn, *args, **kwargs):
+        self.tasks.append((name, fn, args, kwargs))
+        return self
+
+    def get_task_names(self):
+        return [task[0] for task in self.tasks]
+
+class StageStatistics:
+    # Cost and rejection rate of the stages during a reduction. The
+    # statistics are shared between the interestingness tests through an
+    # SQLite database so that later tests start with the learned order. The
+    # object itself is shared by the threads of the test server.
+    def __init__(self, path=None, min_runs=10):
+        self.path = path
+        self.min_runs = min_runs
+        self.stats = None
+        self.lock = threading.RLock()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS stages (name TEXT PRIMARY KEY, runs INTEGER NOT NULL, rejections INTEGER NOT NULL, time REAL NOT NULL)")
+        return connection
+
+    def load(self):
+        with self.lock:
+            return self._load()
+
+    def _load(self):
+        if self.stats is not None:
+            return self.stats
+
+        self.stats = dict()
+
+        if self.path is not None:
+            try:
+                connection = self._connect()
+
+                for (name, runs, rejections, duration) in connection.execute("SELECT name, runs, rejections, time FROM stages"):
+                    self.stats[name] = [runs, rejections, duration]
+
+                connection.close()
+            except sqlite3.Error:
+                pass
+
+        return self.stats
+
+    def record(self, records):
+        with self.lock:
+            stats = self._load()
+
+            for (name, duration, rejected) in records:
+                entry = stats.setdefault(name, [0, 0, 0.0])
+                entry[0] += 1
+                entry[1] += int(rejected)
+                entry[2] += duration
+
+        if self.path is None or not records:
+            return
+
+        try:
+            connection = self._connect()
+
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+
+                for (name, duration, rejected) in records:
+                    connection.execute("INSERT OR IGNORE INTO stages (name, runs, rejections, time) VALUES (?, 0, 0, 0.0)", (name,))
+                    connection.execute("UPDATE stages SET runs = runs + 1, rejections = rejections + ?, time = time + ? WHERE name = ?", (int(rejected), duration, name))
+
+            connection.close()
+        except sqlite3.Error:
+            pass
+
+    def get_order(self, names):
+        with self.lock:
+            stats = {name : list(entry) for (name, entry) in self._load().items()}
+
+        # Stages which reject most test cases per second of runtime come first.
+        # Stages which have not been observed often enough keep their default
+        # position relative to each other (the sort is stable).
+        def rejections_per_second(name):
+            if name not in stats or stats[name][0] < self.min_runs:
+                return 0.0
+
+            (_, rejections, duration) = stats[name]
+            return rejections / max(duration, 1e-6)
+
+        return sorted(names, key=rejections_per_second, reverse=True)
+
+class PersistentCache:
+    # Content-addressed key/value store which can be shared between the
+    # parallel interestingness tests of C-Reduce (SQLite in WAL mode).
+    # Entries are evicted in LRU order once the total size exceeds max_size.
+    # Estimated storage of a row apart from its key and value (record header,
+    # rowid, last_used and the entry in the last_used index)
+    row_overhead = 64
+    # Eviction frees more than necessary so that it does not have to run on
+    # every put once the cache is full
+    low_water_mark = 0.9
+
+    def __init__(self, path, table, max_size=None, timeout=60):
+        self.path = path
+        self.table = table
+        self.max_size = max_size
+
+        self.connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS {} (key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)".format(self.table))
+        self.connection.execute("CREATE INDEX IF NOT EXISTS {0}_last_used ON {0} (last_used)".format(self.table))
+        # Running total of the sizes per table so that a put does not have to
+        # sum up the whole table
+        self.connection.execute("CREATE TABLE IF NOT EXISTS cache_sizes (name TEXT PRIMARY KEY, total INTEGER NOT NULL)")
+
+        if self.connection.execute("SELECT 1 FROM cache_sizes WHERE name = ?", (self.table,)).fetchone() is None:
+            self.connection.execute("INSERT OR IGNORE INTO cache_sizes (name, total) SELECT ?, TOTAL(size) FROM {}".format(self.table), (self.table,))
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        if getattr(self, "connection", None) is not None:
+            self.connection.close()
+            self.connection = None
+
+    @classmethod
+    def get_size(cls, key, value):
+        # The key is stored twice, in the table and in its primary key index
+        return 2 * len(key) + len(value) + cls.row_overhead
+
+    def get_total_size(self):
+        (total_size,) = self.connection.execute("SELECT total FROM cache_sizes WHERE name = ?", (self.table,)).fetchone()
+
+        return total_size
+
+    def get(self, key, default=None):
+        try:
+            row = self.connection.execute("SELECT value FROM {} WHERE key = ?".format(self.table), (key,)).fetchone()
+
+            if row is None:
+                return default
+
+            self.connection.execute("UPDATE {} SET last_used = ? WHERE key = ?".format(self.table), (time.time(), key))
+        except sqlite3.Error:
+            return default
+
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        value = json.dumps(value)
+        size = self.get_size(key, value)
+
+        try:
+            # The total is only consistent if the row and the total are
+            # updated together
+            self.connection.execute("BEGIN IMMEDIATE")
+
+            try:
+                row = self.connection.execute("SELECT size FROM {} WHERE key = ?".format(self.table), (key,)).fetchone()
+                old_size = row[0] if row is not None else 0
+
+                self.connection.execute("INSERT OR REPLACE INTO {} (key, value, size, last_used) VALUES (?, ?, ?, ?)".format(self.table), (key, value, size, time.time()))
+                self.connection.execute("UPDATE cache_sizes SET total = total + ? WHERE name = ?", (size - old_size, self.table))
+
+                if self.max_size is not None and self.get_total_size() > self.max_size:
+                    self.evict(int(self.max_size * self.low_water_mark))
+
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            pass
+
+    def evict(self, max_size):
+        total_size = self.get_total_size()
+
+        if total_size <= max_size:
+            return
+
+        # Drop least recently used entries until the cache fits again
+        keys = []
+        freed_size = 0
+
+        for (key, size) in self.connection.execute("SELECT key, size FROM {} ORDER BY last_used ASC".format(self.table)):
+            if total_size - freed_size <= max_size:
+                break
+
+            keys.append(key)
+            freed_size += size
+
+        self.connection.executemany("DELETE FROM {} WHERE key = ?".format(self.table), [(key,) for key in keys])
+        self.connection.execute("UPDATE cache_sizes SET total = total - ? WHERE name = ?", (freed_size, self.table))
+
 class InterestingnessTest:
+    # Options which do not influence the verdict of a test and are therefore
+    # not part of the cache key
+    cache_independent_options = {"cache", "cache_size", "jobs", "stats", "telemetry"}
+
     @classmethod
     def get_test_options(cls, env):
-        return dict()
+        options = dict()
+
+        options["cache"] = env.get("CREDUCE_TEST_CACHE")
+        options["cache_size"] = env.get("CREDUCE_TEST_CACHE_SIZE")
+        options["jobs"] = env.get("CREDUCE_TEST_JOBS")
+        options["stats"] = env.get("CREDUCE_TEST_STATS")
+        options["telemetry"] = env.get("CREDUCE_TEST_TELEMETRY")
+
+        return options
 
     def __init__(self, test_cases, options):
-        self.test_cases = test_cases
+        # Every file is read (and hashed) at most once per test
+        self.test_cases = [testcase.TestCase.get(test_case) for test_case in test_cases]
         self.options = options
 
+        if "cache" in self.options and self.options["cache"] is not None:
+            self.cache_path = os.path.abspath(str(self.options["cache"]))
+        else:
+            self.cache_path = None
+
+        if "cache_size" in self.options and self.options["cache_size"] is not None:
+            # Size in MiB
+            self.cache_size = int(self.options["cache_size"]) * 1024 * 1024
+        else:
+            self.cache_size = 256 * 1024 * 1024
+
+        if "jobs" in self.options and self.options["jobs"] is not None:
+            self.jobs = max(1, int(self.options["jobs"]))
+        else:
+            self.jobs = 1
+
+        if "stats" in self.options and self.options["stats"] is not None:
+            self.stage_statistics = StageStatistics(os.path.abspath(str(self.options["stats"])))
+        else:
+            self.stage_statistics = StageStatistics()
+
+        if "telemetry" in self.options and self.options["telemetry"] is not None:
+            self.telemetry_path = os.path.abspath(str(self.options["telemetry"]))
+        else:
+            self.telemetry_path = None
+
+        # Stages of the running check (only collected for the telemetry)
+        self.telemetry_stages = []
+        # Set if the outcome of the test is no longer needed
+        self.cancelled = False
+        # Set by a check whose outcome depends on the machine rather than on
+        # the test case, e.g. because a tool timed out or crashed
+        self.transient_failure = False
+
+    def cancel_tasks(self):
+        pass
+
+    def cancel(self):
+        # Aborts a running check from another thread
+        self.cancelled = True
+        self.cancel_tasks()
+
+    def get_evaluator(self):
+        if self.jobs > 1:
+            return ConcurrentEvaluator(self.jobs, self.cancel_tasks)
+        else:
+            return SequentialEvaluator()
+
+    def submit_stages(self, evaluator, stages):
+        # Submit the stages in the learned order (which is also the order of
+        # execution for a limited number of concurrent tasks)
+        stages = {stage.name : stage for stage in stages}
+        stages = [stages[name] for name in self.stage_statistics.get_order(list(stages.keys()))]
+
+        for stage in stages:
+            for (name, fn, args, kwargs) in stage.tasks:
+                evaluator.submit(name, fn, *args, **kwargs)
+
+        return stages
+
+    def _validate_stage(self, results, stage):
+        try:
+            passed = stage.validate(results)
+        except TestTimeoutError:
+            stage.passed = False
+            stage.reason = "timeout"
+            raise
+
+        stage.passed = bool(passed)
+
+        if not stage.passed:
+            if isinstance(passed, Rejection):
+                stage.reason = passed.reason
+                raise InvalidTestCaseError("{} ({})".format(stage.name, passed.reason))
+
+            raise InvalidTestCaseError(stage.name)
+
+    def validate_stages(self, results, stages):
+        # Early bailout if any of the finished stages failed
+        for stage in stages:
+            if all(results.is_done(name) for name in stage.get_task_names()):
+                self._validate_stage(results, stage)
+
+        for stage in stages:
+            self._validate_stage(results, stage)
+
+    def record_stages(self, results, stages):
+        records = []
+
+        for stage in stages:
+            names = [name for name in stage.get_task_names() if results.is_done(name)]
+
+            # Only decided stages with actual work are meaningful
+            if stage.passed is None or not names:
+                continue
+
+            duration = sum(results.get_duration(name) or 0.0 for name in names)
+            records.append((stage.name, duration, not stage.passed))
+
+            if self.telemetry_path is not None:
+                self.telemetry_stages.append({"stage" : stage.name,
+                                              "tools" : names,
+                                              "duration" : duration,
+                                              "outcome" : "passed" if stage.passed else "rejected",
+                                              "reason" : str(stage.reason) if stage.reason is not None else None})
+
+        self.stage_statistics.record(records)
+
+    def get_tool_usages(self):
+        # Resource usage of the tools run so far (see runner.Usage)
+        return []
+
+    def get_signature(self):
+        # JSON serialisable description of the bug found by the last
+        # interesting check or None if the test does not distinguish bugs
+        return None
+
+    def write_telemetry(self, start, outcome, reason=None, usages=None):
+        if self.telemetry_path is None:
+            return
+
+        event = {"time" : time.time() - (time.monotonic() - start),
+                 "test_case" : self.test_cases[0].path if self.test_cases else None,
+                 "duration" : time.monotonic() - start,
+                 "outcome" : outcome,
+                 "reason" : reason,
+                 "stages" : self.telemetry_stages,
+                 "tools" : [{"tool" : usage.tool,
+                             "duration" : usage.wall_time,
+                             "cpu_time" : usage.cpu_time,
+                             "max_rss" : usage.max_rss,
+                             "outcome" : usage.status} for usage in (usages or [])]}
+
+        self.telemetry_stages = []
+
+        try:
+            telemetry.append_event(self.telemetry_path, event)
+        except OSError:
+            pass
+
+    def get_cache(self, table):
+        if self.cache_path is None:
+            return None
+
+        try:
+            return PersistentCache(self.cache_path, table, self.cache_size)
+        except sqlite3.Error:
+            return None
+
+    def get_cache_key(self):
+        key = hashlib.sha256()
+        key.update(type(self).__name__.encode())
+
+        options = {k : v for (k, v) in self.options.items() if k not in self.cache_independent_options}
+        key.update(json.dumps(options, sort_keys=True, default=str).encode())
+
+        for test_case in self.test_cases:
+            key.update(test_case.get_digest())
+
+        return key.hexdigest()
+
     def check(self):
         raise NotImplementedError("Please use a custom interestingness test class!")
 
-    def run(self):
+    def run_check(self):
+        # Same as check() but records the outcome in the telemetry file
+        start = time.monotonic()
+        first_usage = len(self.get_tool_usages())
+        self.telemetry_stages = []
+        self.transient_failure = False
+        outcome = "error"
+        reason = None
+
         try:
             result = self.check()
+            outcome = "interesting" if result else "not interesting"
+            return result
+        except TestTimeoutError as err:
+            (outcome, reason) = ("timeout", str(err))
+            raise
+        except InvalidTestCaseError as err:
+            (outcome, reason) = ("invalid", str(err))
+            raise
+        finally:
+            if self.cancelled:
+                outcome = "cancelled"
+
+            self.write_telemetry(start, outcome, reason, self.get_tool_usages()[first_usage:])
+
+    def get_exit_code(self):
+        cache = self.get_cache("verdicts")
+
+        if cache is not None:
+            key = self.get_cache_key()
+            exit_code = cache.get(key)
+
+            if exit_code is not None:
+                cache.close()
+                self.write_telemetry(time.monotonic(), "cached")
+                return exit_code
+
+        try:
+            result = self.run_check()
         except TestTimeoutError:
-            sys.exit(-1)
+            exit_code = -1
         except InvalidTestCaseError:
-            sys.exit(-2)
-
-        if result:
-            sys.exit(0)
+            exit_code = -2
         else:
-            sys.exit(1)
+            exit_code = 0 if result else 1
+
+        if cache is not None:
+            # Only verdicts which are properties of the test case are kept
+            if exit_code != -1 and not self.transient_failure and not self.cancelled:
+                cache.put(key, exit_code)
+
+            cache.close()
+
+        return exit_code
+
+    def run(self):
+        sys.exit(self.get_exit_code())
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+# Minimal client which forwards a variant to a running test server (see
+# server.py) and exits with the status code of the interestingness test.
+# Only depends on the standard library to keep the startup cheap.
+
+import json
+import os
+import socket
+import sys
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        test_case = sys.argv[1]
+    else:
+        test_case = os.environ.get("CREDUCE_TEST_CASE")
+
+    address = os.environ.get("CREDUCE_TEST_SERVER")
+
+    if test_case is None or address is None:
+        print("No test case or server! Set $CREDUCE_TEST_CASE and $CREDUCE_TEST_SERVER")
+        sys.exit(1)
+
+    request = json.dumps({"test_case" : test_case, "cwd" : os.getcwd()}) + "\n"
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(address)
+            sock.sendall(request.encode())
+
+            with sock.makefile("r") as response:
+                exit_code = int(response.readline())
+    except (OSError, ValueError) as err:
+        print("Test server not reachable: {}".format(err))
+        sys.exit(1)
+
+    sys.exit(exit_code)
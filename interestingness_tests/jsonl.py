@@ -0,0 +1,25 @@
+import json
+import os
+
+# JSON lines files which are shared by parallel processes (telemetry of the
+# interestingness tests, manifest and bug signatures of the helper script)
+
+def append_record(path, record):
+    line = (json.dumps(record, sort_keys=True) + "\n").encode()
+
+    # Single write so that the lines of parallel writers are not interleaved
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+def read_records(path):
+    with open(path, "r") as records_file:
+        for line in records_file:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Incomplete last line of an aborted writer
+                continue
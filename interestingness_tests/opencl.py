@@ -1,10 +1,66 @@
+from enum import Enum
 from interestingness_tests import base
+from interestingness_tests import prefilter
+from interestingness_tests import rules
+from interestingness_tests import runner
+from interestingness_tests import stream
+import hashlib
+import json
 import os
 import platform
-import re
 import subprocess
+import sys
+import threading
+
+class OracleStage(base.Stage):
+    # Implicitly checks if test case is valid in Oclgrind
+    def __init__(self, test, test_case, timeout):
+        super().__init__("oracle")
+        self.test = test
+        self.test_case = test_case
+        self.oracle = test.get_cached_oracle_result(test_case)
+
+        if self.oracle is None:
+            self.add_task("oracle_optimised", test._run_oclgrind, test_case, timeout, optimised=True)
+            self.add_task("oracle_unoptimised", test._run_oclgrind, test_case, timeout, optimised=False)
+
+    def validate(self, results):
+        if self.oracle is None:
+            (output, reason) = self.test.decide_oracle(results)
+            self.oracle = {"output" : output, "reason" : reason}
+
+            if reason == "error":
+                self.test.transient_failure = True
+
+            # The oracle of a check which depends on the machine (e.g. a tool
+            # has been killed) would poison all later checks
+            if not self.test.transient_failure:
+                self.test.put_cached_oracle_result(self.test_case, output, reason)
+
+        return self.oracle["output"] is not None
+
+class DeviceResults:
+    # View of the results of one device in which its runs are accessible under
+    # the names used for a single device
+    def __init__(self, results, names):
+        self.results = results
+        self.names = names
+
+    def is_done(self, name):
+        return self.results.is_done(self.names.get(name, name))
+
+    def get(self, name):
+        return self.results.get(self.names.get(name, name))
 
 class OpenCLInterestingnessTest(base.InterestingnessTest):
+    class DeviceMode(Enum):
+        # Interesting on at least one device
+        any = "any"
+        # Interesting on every device
+        all = "all"
+        # Interesting on more than half of the devices
+        majority = "majority"
+
     @classmethod
     def get_test_options(cls, env):
         options = super().get_test_options(env)
@@ -14,8 +70,16 @@ class OpenCLInterestingnessTest(base.InterestingnessTest):
         options["libclc_include_path"] = env.get("CREDUCE_LIBCLC_INCLUDE_PATH")
         options["platform"] = env.get("CREDUCE_TEST_PLATFORM")
         options["device"] = env.get("CREDUCE_TEST_DEVICE")
+        options["devices"] = env.get("CREDUCE_TEST_DEVICES")
+        options["device_mode"] = env.get("CREDUCE_TEST_DEVICE_MODE")
         options["timeout"] = env.get("CREDUCE_TEST_TIMEOUT")
+        options["timeouts"] = env.get("CREDUCE_TEST_TIMEOUTS")
+        options["timeout_factor"] = env.get("CREDUCE_TEST_TIMEOUT_FACTOR")
+        options["timeout_floor"] = env.get("CREDUCE_TEST_TIMEOUT_FLOOR")
+        options["memory_limit"] = env.get("CREDUCE_TEST_MEMORY_LIMIT")
+        options["cpu_limit"] = env.get("CREDUCE_TEST_CPU_LIMIT")
         options["conservative"] = env.get("CREDUCE_TEST_CONSERVATIVE")
+        options["rules"] = env.get("CREDUCE_TEST_RULES")
 
         return options
 
@@ -30,6 +94,22 @@ class OpenCLInterestingnessTest(base.InterestingnessTest):
         else:
             self.timeout = 300
 
+        if "timeout_factor" in self.options and self.options["timeout_factor"] is not None:
+            self.timeout_factor = float(self.options["timeout_factor"])
+        else:
+            self.timeout_factor = 10.0
+
+        if "timeout_floor" in self.options and self.options["timeout_floor"] is not None:
+            self.timeout_floor = float(self.options["timeout_floor"])
+        else:
+            self.timeout_floor = 10.0
+
+        # Runtimes of the tools for the original test case
+        if "timeouts" in self.options and self.options["timeouts"] is not None:
+            self.baseline_runtimes = self.load_baseline_runtimes(str(self.options["timeouts"]))
+        else:
+            self.baseline_runtimes = None
+
         if "clang" in self.options and self.options["clang"] is not None:
             self.clang = str(self.options["clang"])
         else:
@@ -55,12 +135,201 @@ class OpenCLInterestingnessTest(base.InterestingnessTest):
         else:
             self.device = 0
 
+        if "devices" in self.options and self.options["devices"] is not None:
+            self.devices = self.parse_devices(str(self.options["devices"]))
+        else:
+            self.devices = [(self.platform, self.device)]
+
+        if "device_mode" in self.options and self.options["device_mode"] is not None:
+            try:
+                self.device_mode = self.DeviceMode(self.options["device_mode"])
+            except ValueError:
+                print("Invalid device mode!")
+                sys.exit(1)
+        else:
+            self.device_mode = self.DeviceMode.any
+
         if "conservative" in self.options and self.options["conservative"] is not None:
             self.conservative = bool(int(self.options["conservative"]))
         else:
             self.conservative = True
 
-    def _run_clang(self, test_case, timeout, extra_args=None):
+        if "rules" in self.options and self.options["rules"] is not None:
+            self.rule_set = rules.get_rule_set(str(self.options["rules"]))
+        else:
+            self.rule_set = rules.get_rule_set()
+
+        if "memory_limit" in self.options and self.options["memory_limit"] is not None:
+            # Size in MiB
+            memory_limit = int(self.options["memory_limit"]) * 1024 * 1024
+        else:
+            memory_limit = None
+
+        if "cpu_limit" in self.options and self.options["cpu_limit"] is not None:
+            cpu_limit = int(self.options["cpu_limit"])
+        else:
+            cpu_limit = None
+
+        # Directory in which the tools are run (current directory if None)
+        self.working_dir = None
+        self.runner = runner.Runner(memory_limit, cpu_limit)
+        # Longest runtime of each tool during this test
+        self.runtimes = dict()
+        self.runtimes_lock = threading.Lock()
+
+    @staticmethod
+    def parse_devices(devices_str):
+        # Comma separated list of platform:device pairs, e.g. "0:0,0:1,1:0"
+        devices = []
+
+        try:
+            for entry in devices_str.split(","):
+                (platform, device) = entry.split(":")
+                devices.append((int(platform), int(device)))
+        except ValueError:
+            print("Invalid device list!")
+            sys.exit(1)
+
+        if not devices:
+            print("Invalid device list!")
+            sys.exit(1)
+
+        return devices
+
+    def get_device_run_name(self, name, device):
+        # Runs of a single device keep their plain names
+        if len(self.devices) == 1:
+            return name
+
+        return "{}_{}_{}".format(name, *device)
+
+    def get_device_results(self, results, device, names):
+        return DeviceResults(results, {name : self.get_device_run_name(name, device) for name in names})
+
+    def is_device_verdict_settled(self, interesting, uninteresting):
+        count = len(self.devices)
+
+        if self.device_mode is self.DeviceMode.any:
+            if interesting > 0:
+                return True
+            elif uninteresting == count:
+                return False
+        elif self.device_mode is self.DeviceMode.all:
+            if uninteresting > 0:
+                return False
+            elif interesting == count:
+                return True
+        elif self.device_mode is self.DeviceMode.majority:
+            if interesting > count // 2:
+                return True
+            elif uninteresting >= count - count // 2:
+                return False
+
+        return None
+
+    def decide_devices(self, decide_device):
+        # Combines the verdicts of the devices and returns as soon as the
+        # combined verdict is settled (pending runs are then cancelled). A
+        # device on which the test case is invalid counts as uninteresting.
+        interesting = 0
+        uninteresting = 0
+        errors = []
+        pending = None
+
+        for device in self.devices:
+            try:
+                verdict = decide_device(device)
+            except base.PendingResultError as err:
+                pending = err
+                continue
+            except (base.InvalidTestCaseError, base.TestTimeoutError) as err:
+                if len(self.devices) == 1:
+                    raise
+
+                errors.append(err)
+                verdict = False
+
+            if verdict:
+                interesting += 1
+            else:
+                uninteresting += 1
+
+            settled = self.is_device_verdict_settled(interesting, uninteresting)
+
+            if settled is not None:
+                if not settled and len(errors) == len(self.devices):
+                    raise errors[0]
+
+                return settled
+
+        raise pending
+
+    def cancel_tasks(self):
+        self.runner.cancel()
+
+    def get_tool_usages(self):
+        return self.runner.usages
+
+    def get_evaluator(self):
+        # A cancel() before the check has started also applies to its tools
+        self.runner.start(lambda: self.cancelled)
+        return super().get_evaluator()
+
+    @staticmethod
+    def load_baseline_runtimes(path):
+        try:
+            with open(path, "r") as timeouts_file:
+                return json.load(timeouts_file)["runtimes"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def calibrate_timeouts(self, path):
+        # Runs the test once for the original test case and stores the
+        # runtimes of the tools. Tools which did not run (or timed out) keep
+        # the fixed timeout.
+        self.baseline_runtimes = None
+        self.runtimes = dict()
+
+        try:
+            interesting = bool(self.run_check())
+        except (base.TestTimeoutError, base.InvalidTestCaseError):
+            interesting = False
+
+        with open(path, "w") as timeouts_file:
+            json.dump({"test_case" : self.test_case.get_hash(), "interesting" : interesting, "runtimes" : self.runtimes}, timeouts_file, indent=4, sort_keys=True)
+
+        self.baseline_runtimes = dict(self.runtimes)
+
+        return interesting
+
+    def get_timeout(self, tool, timeout):
+        # The fixed timeout is only an upper bound if the tool has been
+        # calibrated
+        if self.baseline_runtimes is None or tool not in self.baseline_runtimes:
+            return timeout
+
+        return min(timeout, self.timeout_factor * self.baseline_runtimes[tool] + self.timeout_floor)
+
+    def _run_tool(self, tool, cmd, timeout, consumer=None):
+        try:
+            proc = self.runner.run(cmd, self.get_timeout(tool, timeout), cwd=self.working_dir, name=tool, consumer=consumer)
+        except subprocess.TimeoutExpired:
+            self.transient_failure = True
+            raise base.TestTimeoutError(tool)
+        except subprocess.SubprocessError:
+            return None
+
+        # Tools killed by a signal (e.g. by the out-of-memory killer) have
+        # not necessarily failed because of the test case
+        if proc.returncode is not None and proc.returncode < 0 and not proc.stopped:
+            self.transient_failure = True
+
+        with self.runtimes_lock:
+            self.runtimes[tool] = max(self.runtimes.get(tool, 0.0), proc.usage.wall_time)
+
+        return proc
+
+    def _run_clang(self, test_case, timeout, extra_args=None, tool="clang", consumer=None):
         cmd = [self.clang]
         cmd.extend(["-x", "cl", "-fno-builtin", "-include", "clc/clc.h", "-Dcl_clang_storage_class_specifiers", "-g", "-c", "-Wall", "-Wextra", "-pedantic", "-Wconditional-uninitialized", "-Weverything", "-Wno-reserved-id-macro", "-fno-caret-diagnostics", "-fno-diagnostics-fixit-info", "-O1"])
 
@@ -70,84 +339,71 @@ class OpenCLInterestingnessTest(base.InterestingnessTest):
         if extra_args is not None:
             cmd.extend(extra_args)
 
-        cmd.append(test_case)
+        cmd.append(test_case.path)
 
-        try:
-            return subprocess.run(cmd, universal_newlines=True, timeout=timeout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        except subprocess.TimeoutExpired:
-            raise base.TestTimeoutError("clang")
-        except subprocess.SubprocessError:
-            return None
+        return self._run_tool(tool, cmd, timeout, consumer)
 
     def _run_csa(self, test_case, timeout):
         #TODO: Maybe use scan-build?!
         #csa_args = ["-Xclang", "-analyze", "-Xclang", "-analyzer-checker", "-Xclang", "alpha,core,security,unix"]
         csa_args = ["--analyze", "-Xclang", "-analyzer-checker", "-Xclang", "alpha,core,security,unix"]
 
-        try:
-            return self._run_clang(test_case, timeout, csa_args)
-        except base.TestTimeoutError:
-            raise base.TestTimeoutError("clang static analyzer")
+        return self._run_clang(test_case, timeout, csa_args, tool="clang static analyzer")
 
     def _run_oclgrind(self, test_case, timeout, optimised):
         cmd = ["oclgrind"]
         cmd.extend(["-Wall", "--uninitialized", "--arithmetic-exceptions", "--data-races", "--uniform-writes", "--stop-errors", "1"])
         cmd.append(self.cl_launcher)
-        cmd.extend(["-p", "0", "-d", "0", "-f", test_case])
+        cmd.extend(["-p", "0", "-d", "0", "-f", test_case.path])
 
         if not optimised:
             cmd.append("---disable_opts")
 
-        try:
-            return subprocess.run(cmd, universal_newlines=True, timeout=timeout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        except subprocess.TimeoutExpired:
-            raise base.TestTimeoutError("oclgrind")
-        except subprocess.SubprocessError:
-            return None
+        # The output is only kept as fingerprint (see stream.py)
+        return self._run_tool("oclgrind", cmd, timeout, stream.StreamComparator())
 
-    def _run_cl_launcher(self, test_case, platform, device, timeout, optimised):
+    def _run_cl_launcher(self, test_case, platform, device, timeout, optimised, get_reference=None, stop_on_divergence=False):
         cmd = [self.cl_launcher]
-        cmd.extend(["-p", str(platform), "-d", str(device), "-f", test_case])
+        cmd.extend(["-p", str(platform), "-d", str(device), "-f", test_case.path])
 
         if not optimised:
             cmd.append("---disable_opts")
 
-        try:
-            return subprocess.run(cmd, universal_newlines=True, timeout=timeout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        except subprocess.TimeoutExpired:
-            raise base.TestTimeoutError("cl_launcher")
-        except subprocess.SubprocessError:
-            return None
+        # The output is compared against the reference (if available) while
+        # it is produced
+        return self._run_tool("cl_launcher", cmd, timeout, stream.StreamComparator(get_reference, stop_on_divergence))
 
     def is_valid_result_access(self, test_case):
-        with open(test_case, "r") as test_file:
-            content = test_file.read()
+        return prefilter.has_valid_result_access(prefilter.get_tokens(test_case))
 
-        m = re.search(r"result\s*\[", content)
+    def is_valid_ast(self, test_case, timeout):
+        proc = self._run_clang(test_case, timeout, ["-Xclang", "-ast-dump"], tool="clang ast")
 
-        if m is None:
-            return True
+        if proc is None or proc.returncode != 0:
+            return False
 
-        m = re.search(r"result\s*\[\s*get_linear_global_id\s*\(\s*\)\s*\]", content)
+        return self.is_valid_ast_output(proc.stdout)
 
-        if m is None:
-            return False
+    def find_invalid_diagnostic(self, categories, output):
+        rule = self.rule_set.get_matcher(categories).find(output)
 
-        return True
+        if rule is None:
+            return True
 
-    def is_valid_ast(self, test_case, timeout):
-        try:
-            proc = self._run_clang(test_case, timeout, ["-Xclang", "-ast-dump"])
-        except base.TestTimeoutError:
-            raise base.TestTimeoutError("clang ast")
+        return base.Rejection(rule)
 
-        if proc is None or proc.returncode != 0:
-            return False
+    def is_valid_ast_output(self, output):
+        return self.find_invalid_diagnostic(["ast"], output)
 
-        if (r"PointerToIntegral" not in proc.stdout):
-            return True
+    def get_ast(self, test_case, timeout):
+        # JSON dump of the AST (only the top-level declarations of the test
+        # case itself) or None if Clang fails
+        proc = self._run_clang(test_case, timeout, ["-fsyntax-only", "-Xclang", "-ast-dump=json"], tool="clang ast json", consumer=stream.MainFileASTFilter())
 
-        return False
+        if proc is None or proc.returncode != 0:
+            return None
+
+        return proc.stdout
 
     def is_valid_clang(self, test_case, timeout):
         proc = self._run_clang(test_case, timeout)
@@ -155,29 +411,10 @@ class OpenCLInterestingnessTest(base.InterestingnessTest):
         if proc is None or proc.returncode != 0:
             return False
 
-        if (r"warning: empty struct is a GNU extension" not in proc.stderr and
-            r"warning: use of GNU empty initializer extension" not in proc.stderr and
-            r"warning: incompatible pointer to integer conversion" not in proc.stderr and
-            r"warning: incompatible integer to pointer conversion" not in proc.stderr and
-            r"warning: incompatible pointer types initializing" not in proc.stderr and
-            r"warning: comparison between pointer and integer" not in proc.stderr and
-            r"warning: ordered comparison between pointer and integer" not in proc.stderr and
-            r"warning: ordered comparison between pointer and zero" not in proc.stderr and
-            r"is uninitialized when used within its own initialization [-Wuninitialized]" not in proc.stderr and
-            r"is uninitialized when used here [-Wuninitialized]" not in proc.stderr and
-            r"may be uninitialized when used here [-Wconditional-uninitialized]" not in proc.stderr and
-            r"warning: use of GNU ?: conditional expression extension, omitting middle operand" not in proc.stderr and
-            r"warning: control may reach end of non-void function [-Wreturn-type]" not in proc.stderr and
-            r"warning: control reaches end of non-void function [-Wreturn-type]" not in proc.stderr and
-            r"warning: zero size arrays are an extension [-Wzero-length-array]" not in proc.stderr and
-            r"excess elements in " not in proc.stderr and
-            r"warning: address of stack memory associated with local variable" not in proc.stderr and
-            r"warning: type specifier missing" not in proc.stderr and
-            r"warning: expected ';' at end of declaration list" not in proc.stderr and
-            r" declaration specifier [-Wduplicate-decl-specifier]" not in proc.stderr):
-            return True
+        return self.is_valid_clang_output(proc.stderr)
 
-        return False
+    def is_valid_clang_output(self, stderr):
+        return self.find_invalid_diagnostic(["clang"], stderr)
 
     def is_valid_csa(self, test_case, timeout):
         proc = self._run_csa(test_case, timeout)
@@ -185,56 +422,58 @@ class OpenCLInterestingnessTest(base.InterestingnessTest):
         if proc is None or proc.returncode != 0:
             return False
 
-        if ("warning: Assigned value is garbage or undefined" not in proc.stderr and
-            "warning: Undefined or garbage value returned to caller" not in proc.stderr and
-            "is a garbage value" not in proc.stderr and
-            "warning: Function call argument is an uninitialized value" not in proc.stderr and
-            "warning: Dereference of null pointer" not in proc.stderr and
-            "warning: Array subscript is undefined" not in proc.stderr and
-            "results in a dereference of a null pointer" not in proc.stderr):
-            return True
-
-        return False
-
-    def is_valid_cl_launcher_test_case(self, test_case):
-        with open(test_case, "r") as test_file:
-            content = test_file.read()
+        return self.is_valid_csa_output(proc.stderr)
 
-        # Make sure comment with dimensions is preserved
-        m = re.match(r"//.* -g [0-9]+,[0-9]+,[0-9]+ -l [0-9]+,[0-9]+,[0-9]+", content)
+    def is_valid_csa_output(self, stderr):
+        return self.find_invalid_diagnostic(["csa"], stderr)
 
-        if m is None:
-            return False
+    def is_valid_syntax(self, test_case, conservative):
+        problem = prefilter.find_problem(test_case, conservative)
 
-        # Early bailout if we trust Oclgrind to catch all problems
-        if not self.conservative:
+        if problem is None:
             return True
 
-        # Access to result only with get_linear_global_id()
-        if not self.is_valid_result_access(test_case):
-            return False
-
-        # Must not change get_linear_global_id
-        m = re.search(r"return\s*\(\s*get_global_id\s*\(\s*2\s*\)\s*\*\s*get_global_size\s*\(\s*1\s*\)\s*\+\s*get_global_id\s*\(\s*1\s*\)\s*\)\s*\*\s*get_global_size\s*\(\s*0\s*\)\s*\+\s*get_global_id\s*\(\s*0\s*\)\s*;", content)
+        return base.Rejection(problem)
 
-        if m is None:
-            return False
-
-        return True
+    def is_valid_cl_launcher_test_case(self, test_case):
+        # Make sure comment with dimensions is preserved. The remaining checks
+        # are skipped if we trust Oclgrind to catch all problems.
+        return self.is_valid_syntax(test_case, self.conservative)
+
+    def check_syntax(self, test_case, conservative):
+        # Rejects syntactically broken variants in-process before any tool is
+        # started (the evaluators might start all tools at once)
+        with base.SequentialEvaluator() as evaluator:
+            stages = self.submit_stages(evaluator, [base.Stage("syntax").add_task("syntax", self.is_valid_syntax, test_case, conservative)])
+
+            try:
+                evaluator.evaluate(lambda results: self.validate_stages(results, stages))
+            finally:
+                self.record_stages(evaluator, stages)
+
+    def get_static_stages(self, test_case, timeout):
+        # Run static analysis of the program
+        # Better support for uninitialised values
+        return [base.Stage("ast").add_task("ast", self.is_valid_ast, test_case, timeout),
+                base.Stage("clang").add_task("clang", self.is_valid_clang, test_case, timeout),
+                base.Stage("csa").add_task("csa", self.is_valid_csa, test_case, timeout)]
 
     def is_statically_valid(self, test_case, timeout):
-        if not self.is_valid_ast(test_case, timeout):
-            return False
+        def decide(results):
+            try:
+                self.validate_stages(results, stages)
+            except base.InvalidTestCaseError:
+                return False
 
-        # Run static analysis of the program
-        # Better support for uninitialised values
-        if not self.is_valid_clang(test_case, timeout):
-            return False
+            return True
 
-        if not self.is_valid_csa(test_case, timeout):
-            return False
+        with self.get_evaluator() as evaluator:
+            stages = self.submit_stages(evaluator, self.get_static_stages(test_case, timeout))
 
-        return True
+            try:
+                return evaluator.evaluate(decide)
+            finally:
+                self.record_stages(evaluator, stages)
 
     def is_valid_oclgrind(self, test_case, timeout, optimised):
         #TODO: Necessary to run both?
@@ -245,22 +484,81 @@ class OpenCLInterestingnessTest(base.InterestingnessTest):
 
         return True
 
-    def get_oracle_result(self, test_case, timeout):
-        proc_opt = self._run_oclgrind(test_case, timeout, optimised=True)
+    def get_oracle_key(self, test_case):
+        key = hashlib.sha256()
+        # Oracle outputs are stored as fingerprints (of SHA-1 chunk digests)
+        key.update(b"fingerprint-sha1")
+        key.update(self.cl_launcher.encode())
+        # Oclgrind might fail within the limits of one run but not another
+        key.update(json.dumps([self.runner.memory_limit, self.runner.cpu_limit]).encode())
+        key.update(test_case.get_normalised_hash().encode())
 
-        if proc_opt is None or proc_opt.returncode != 0:
-            return None
+        return key.hexdigest()
 
-        proc_unopt = self._run_oclgrind(test_case, timeout, optimised=False)
+    def get_cached_oracle_result(self, test_case):
+        cache = self.get_cache("oracle")
 
-        if proc_unopt is None or proc_unopt.returncode != 0:
+        if cache is None:
             return None
 
+        entry = cache.get(self.get_oracle_key(test_case))
+        cache.close()
+
+        if entry is not None and entry["output"] is not None:
+            entry["output"] = stream.OutputFingerprint.from_json(entry["output"])
+
+        return entry
+
+    def put_cached_oracle_result(self, test_case, output, reason):
+        # Errors of the tools themselves are not a property of the test case
+        if reason == "error":
+            return
+
+        cache = self.get_cache("oracle")
+
+        if cache is None:
+            return
+
+        cache.put(self.get_oracle_key(test_case), {"output" : output.to_json() if output is not None else None, "reason" : reason})
+        cache.close()
+
+    def get_oracle_stage(self, test_case, timeout):
+        return OracleStage(self, test_case, timeout)
+
+    def decide_oracle(self, results):
+        proc_opt = results.get("oracle_optimised")
+
+        # Oclgrind killed by a signal (e.g. by the out-of-memory killer or a
+        # resource limit) is an error of the tool, not of the test case
+        if proc_opt is None or proc_opt.returncode < 0:
+            return (None, "error")
+        elif proc_opt.returncode != 0:
+            return (None, "optimised")
+
+        proc_unopt = results.get("oracle_unoptimised")
+
+        if proc_unopt is None or proc_unopt.returncode < 0:
+            return (None, "error")
+        elif proc_unopt.returncode != 0:
+            return (None, "unoptimised")
+
         # Check for error in Oclgrind/Clang
         if proc_opt.stdout != proc_unopt.stdout:
-            return None
+            return (None, "disagree")
+
+        return (proc_opt.stdout, None)
+
+    def get_oracle_result(self, test_case, timeout):
+        # Variants which only differ in whitespace or comments share the oracle
+        with self.get_evaluator() as evaluator:
+            stage = self.get_oracle_stage(test_case, timeout)
+
+            for (name, fn, args, kwargs) in stage.tasks:
+                evaluator.submit(name, fn, *args, **kwargs)
+
+            evaluator.evaluate(stage.validate)
 
-        return proc_opt.stdout
+        return stage.oracle["output"]
 
     def is_valid_cl_launcher(self, test_case, platform, device, timeout, optimised):
         proc = self._run_cl_launcher(test_case, platform, device, timeout, optimised)
@@ -0,0 +1,76 @@
+# Cheap syntactic checks which are run in-process before any tool is started.
+# They reject variants which are certainly invalid (e.g. unbalanced brackets
+# or a deleted kernel) and the variants which change the parts of the test
+# case that the conservative checks protect.
+
+_brackets = {")" : "(", "]" : "[", "}" : "{"}
+
+_kernel_keywords = {"kernel", "__kernel"}
+
+_result_access = ["result", "[", "get_linear_global_id", "(", ")", "]"]
+
+_linear_global_id = ["return", "(", "get_global_id", "(", "2", ")", "*", "get_global_size", "(", "1", ")", "+",
+                     "get_global_id", "(", "1", ")", ")", "*", "get_global_size", "(", "0", ")", "+",
+                     "get_global_id", "(", "0", ")", ";"]
+
+def _contains(tokens, sequence):
+    first = sequence[0]
+    length = len(sequence)
+
+    return any(token == first and tokens[i:i + length] == sequence for (i, token) in enumerate(tokens))
+
+def is_balanced(tokens):
+    stack = []
+
+    for token in tokens:
+        if token in "([{":
+            stack.append(token)
+        elif token in _brackets:
+            if not stack or stack.pop() != _brackets[token]:
+                return False
+
+    return not stack
+
+def has_kernel_entry(tokens):
+    for (i, token) in enumerate(tokens):
+        if token in _kernel_keywords and tokens[i + 1:i + 4] == ["void", "entry", "("]:
+            return True
+
+    return False
+
+def has_valid_result_access(tokens):
+    # Access to result only with get_linear_global_id()
+    if not any(token == "result" and tokens[i + 1:i + 2] == ["["] for (i, token) in enumerate(tokens)):
+        return True
+
+    return _contains(tokens, _result_access)
+
+def has_linear_global_id(tokens):
+    # Must not change get_linear_global_id
+    return _contains(tokens, _linear_global_id)
+
+def get_tokens(test_case):
+    return [token for (kind, token) in test_case.get_tokens() if kind != "directive"]
+
+def find_problem(test_case, conservative=True):
+    # Returns the reason why the test case (see testcase.TestCase) is invalid
+    # or None
+    if not test_case.get_header():
+        return "header"
+
+    tokens = get_tokens(test_case)
+
+    if not is_balanced(tokens):
+        return "brackets"
+
+    if not has_kernel_entry(tokens):
+        return "kernel entry"
+
+    if conservative:
+        if not has_valid_result_access(tokens):
+            return "result access"
+
+        if not has_linear_global_id(tokens):
+            return "get_linear_global_id"
+
+    return None
@@ -0,0 +1,90 @@
+import json
+import os
+import re
+import threading
+
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.json")
+
+class Rule:
+    def __init__(self, category, name, pattern, regex=False):
+        self.category = category
+        self.name = name
+        self.pattern = pattern
+        self.regex = regex
+
+    def __str__(self):
+        return "{}/{}".format(self.category, self.name)
+
+class Matcher:
+    # All rules compiled into a single alternation so that the output of a
+    # tool is scanned only once
+    def __init__(self, rules):
+        self.rules = rules
+
+        if rules:
+            alternatives = []
+
+            for (index, rule) in enumerate(rules):
+                pattern = rule.pattern if rule.regex else re.escape(rule.pattern)
+                alternatives.append("(?P<r{}>{})".format(index, pattern))
+
+            self.regex = re.compile("|".join(alternatives))
+        else:
+            self.regex = None
+
+    def find(self, text):
+        if self.regex is None or not text:
+            return None
+
+        m = self.regex.search(text)
+
+        if m is None:
+            return None
+
+        return self.rules[int(m.lastgroup[1:])]
+
+class RuleSet:
+    # Forbidden diagnostics grouped by category (e.g. "clang", "csa"). Loaded
+    # from a JSON file mapping each category to a list of rules with a "name",
+    # a "pattern" and optionally "regex": true.
+    def __init__(self, rules):
+        self.rules = rules
+        self.matchers = dict()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as rules_file:
+            config = json.load(rules_file)
+
+        rules = []
+
+        for (category, entries) in config.items():
+            for entry in entries:
+                rules.append(Rule(category, entry["name"], entry["pattern"], entry.get("regex", False)))
+
+        return cls(rules)
+
+    def get_matcher(self, categories):
+        key = tuple(categories)
+
+        with self.lock:
+            if key not in self.matchers:
+                self.matchers[key] = Matcher([rule for rule in self.rules if rule.category in categories])
+
+            return self.matchers[key]
+
+_rule_sets = dict()
+_rule_sets_lock = threading.Lock()
+
+def get_rule_set(path=None):
+    if path is None:
+        path = DEFAULT_RULES_FILE
+
+    path = os.path.abspath(path)
+
+    with _rule_sets_lock:
+        if path not in _rule_sets:
+            _rule_sets[path] = RuleSet.load(path)
+
+        return _rule_sets[path]
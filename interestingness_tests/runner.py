@@ -0,0 +1,243 @@
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+class CancelledError(subprocess.SubprocessError):
+    pass
+
+class Usage:
+    # Resources used by one tool invocation. CPU time and peak RSS (in bytes)
+    # are None if the platform does not report them.
+    def __init__(self, tool, wall_time, cpu_time=None, max_rss=None, status="ok"):
+        self.tool = tool
+        self.wall_time = wall_time
+        self.cpu_time = cpu_time
+        self.max_rss = max_rss
+        self.status = status
+
+class CompletedProcess(subprocess.CompletedProcess):
+    def __init__(self, args, returncode, stdout, stderr, usage, stopped=False):
+        super().__init__(args, returncode, stdout, stderr)
+        self.usage = usage
+        self.stopped = stopped
+
+class Process(subprocess.Popen):
+    # Collects the resource usage of the child when it is reaped
+    rusage = None
+
+    if hasattr(os, "wait4"):
+        def _try_wait(self, wait_flags):
+            try:
+                (pid, sts, rusage) = os.wait4(self.pid, wait_flags)
+            except ChildProcessError:
+                return (self.pid, 0)
+
+            if pid == self.pid:
+                self.rusage = rusage
+
+            return (pid, sts)
+
+    def get_cpu_time(self):
+        if self.rusage is None:
+            return None
+
+        return self.rusage.ru_utime + self.rusage.ru_stime
+
+    def get_max_rss(self):
+        if self.rusage is None:
+            return None
+
+        # Reported in bytes on macOS and in KiB elsewhere
+        if sys.platform == "darwin":
+            return self.rusage.ru_maxrss
+
+        return self.rusage.ru_maxrss * 1024
+
+class CancellationToken:
+    # Cancellation state of the tools of a single check. The live processes
+    # are killed when the token is cancelled and no further tool is started.
+    def __init__(self, cancelled=False):
+        self.cancelled = cancelled
+        self.processes = set()
+
+class Runner:
+    # Runs the tools of an interestingness test and keeps track of the live
+    # processes so that they can be killed once the outcome of a test is known.
+    # Every tool is started in its own process group (session) so that helper
+    # processes are killed together with the tool. Optionally the address
+    # space (bytes) and the CPU time (seconds) of each tool are limited.
+    def __init__(self, memory_limit=None, cpu_limit=None):
+        self.lock = threading.Lock()
+        self.token = CancellationToken()
+        self.memory_limit = memory_limit
+        self.cpu_limit = cpu_limit
+        self.usages = []
+
+    @staticmethod
+    def is_process_group_supported():
+        return hasattr(os, "killpg")
+
+    def _has_limits(self):
+        return resource is not None and (self.memory_limit is not None or self.cpu_limit is not None)
+
+    def _get_command(self, cmd):
+        # A preexec_fn is not safe since the tools are started from several
+        # threads. Without prlimit() the limits are set by a shell which then
+        # executes the tool.
+        if not self._has_limits() or hasattr(resource, "prlimit"):
+            return cmd
+
+        limits = []
+
+        if self.memory_limit is not None:
+            limits.append("ulimit -v {}".format(self.memory_limit // 1024))
+
+        if self.cpu_limit is not None:
+            limits.append("ulimit -t {}".format(self.cpu_limit))
+
+        return ["/bin/sh", "-c", "; ".join(limits) + '; exec "$@"', "sh"] + list(cmd)
+
+    def _set_limits(self, proc):
+        # Applied right after the start, before the tool does any real work
+        if not self._has_limits() or not hasattr(resource, "prlimit"):
+            return
+
+        try:
+            if self.memory_limit is not None:
+                resource.prlimit(proc.pid, resource.RLIMIT_AS, (self.memory_limit, self.memory_limit))
+
+            if self.cpu_limit is not None:
+                resource.prlimit(proc.pid, resource.RLIMIT_CPU, (self.cpu_limit, self.cpu_limit))
+        except OSError:
+            # The tool has already exited
+            pass
+
+    def _kill(self, proc):
+        try:
+            if self.is_process_group_supported():
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+        except OSError:
+            pass
+
+    def _stream(self, proc, timeout, consumer):
+        # Passes stdout to the consumer as it arrives and stops the tool as
+        # soon as the consumer does not need more output
+        stopped = threading.Event()
+
+        def pump():
+            while True:
+                data = proc.stdout.read1(64 * 1024)
+
+                if not data:
+                    break
+
+                if not consumer.feed(data):
+                    stopped.set()
+                    self._kill(proc)
+                    break
+
+        reader = threading.Thread(target=pump, daemon=True)
+        reader.start()
+        reader.join(timeout)
+
+        if reader.is_alive():
+            self._kill(proc)
+            reader.join()
+            proc.wait()
+            raise subprocess.TimeoutExpired(proc.args, timeout)
+
+        proc.stdout.close()
+        proc.wait()
+
+        return (consumer.close(), stopped.is_set())
+
+    def run(self, cmd, timeout, cwd=None, name=None, consumer=None):
+        # Without consumer stdout and stderr are returned as strings. With a
+        # consumer (see stream.StreamComparator) stdout is streamed to it and
+        # the result of consumer.close() is returned as stdout; stderr is
+        # buffered in a temporary file.
+        with self.lock:
+            token = self.token
+
+            if token.cancelled:
+                raise CancelledError(cmd[0])
+
+            start = time.monotonic()
+
+            if consumer is None:
+                proc = Process(self._get_command(cmd), cwd=cwd, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               start_new_session=self.is_process_group_supported())
+            else:
+                stderr_file = tempfile.TemporaryFile()
+                proc = Process(self._get_command(cmd), cwd=cwd, stdout=subprocess.PIPE, stderr=stderr_file,
+                               start_new_session=self.is_process_group_supported())
+
+            self._set_limits(proc)
+
+            token.processes.add(proc)
+
+        status = "ok"
+
+        try:
+            try:
+                if consumer is None:
+                    (stdout, stderr) = proc.communicate(timeout=timeout)
+                else:
+                    (stdout, stopped) = self._stream(proc, timeout, consumer)
+                    stderr_file.seek(0)
+                    stderr = stderr_file.read().decode(errors="replace")
+
+                    if stopped:
+                        status = "stopped"
+            except subprocess.TimeoutExpired:
+                status = "timeout"
+                self._kill(proc)
+
+                if consumer is None:
+                    proc.communicate()
+
+                raise
+        finally:
+            if consumer is not None:
+                stderr_file.close()
+
+            with self.lock:
+                token.processes.discard(proc)
+
+                if token.cancelled and status in ("ok", "stopped"):
+                    status = "cancelled"
+
+                usage = Usage(name or os.path.basename(cmd[0]), time.monotonic() - start, proc.get_cpu_time(), proc.get_max_rss(), status)
+                self.usages.append(usage)
+
+        if status == "cancelled":
+            raise CancelledError(cmd[0])
+
+        # The return code of a stopped tool is not meaningful
+        return CompletedProcess(cmd, proc.returncode, stdout, stderr, usage, stopped=(status == "stopped"))
+
+    def cancel(self):
+        with self.lock:
+            self.token.cancelled = True
+            processes = list(self.token.processes)
+
+        for proc in processes:
+            self._kill(proc)
+
+    def start(self, is_cancelled):
+        # Starts a new check with its own token. The token of the previous
+        # check stays cancelled for its remaining tools. is_cancelled is
+        # called under the lock so that a concurrent cancel() is not lost.
+        with self.lock:
+            self.token = CancellationToken(bool(is_cancelled()))
@@ -0,0 +1,115 @@
+import json
+import os
+import shutil
+import socket
+import socketserver
+import tempfile
+import threading
+
+class TestRequestHandler(socketserver.StreamRequestHandler):
+    def watch_connection(self, test, done):
+        # The client sends nothing after the request, hence the read only
+        # returns once the client has been killed (or the check is done)
+        try:
+            self.connection.recv(1)
+        except OSError:
+            pass
+
+        if not done.is_set():
+            test.cancel()
+
+    def run_test(self, test):
+        done = threading.Event()
+        watcher = threading.Thread(target=self.watch_connection, args=(test, done))
+        watcher.daemon = True
+        watcher.start()
+
+        try:
+            return test.get_exit_code()
+        finally:
+            done.set()
+
+            # Wakes up the watcher
+            try:
+                self.connection.shutdown(socket.SHUT_RD)
+            except OSError:
+                pass
+
+            watcher.join()
+
+    def handle(self):
+        with self.server.slots:
+            try:
+                request = json.loads(self.rfile.readline().decode())
+                test = self.server.create_test(request["test_case"], request.get("cwd"))
+                exit_code = self.run_test(test)
+            except Exception as err:
+                print("Test server failure: {}".format(err))
+                exit_code = 1
+
+        try:
+            self.wfile.write("{}\n".format(exit_code).encode())
+        except OSError:
+            # C-Reduce has killed the client in the meantime
+            pass
+
+class TestServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    # Long-lived server which runs the interestingness test for the variants
+    # forwarded by client.py. Saves the interpreter startup and the option
+    # parsing for every variant tried by C-Reduce. At most max_tests
+    # variants are tested at the same time.
+    daemon_threads = True
+
+    def __init__(self, address, test_class, options, max_tests=1):
+        self.test_class = test_class
+        self.options = options
+        self.slots = threading.BoundedSemaphore(max(1, max_tests))
+        # Built once so that learned state is shared between all variants
+        self.prototype = test_class([], options)
+
+        super().__init__(address, TestRequestHandler)
+
+    def create_test(self, test_case, cwd=None):
+        if cwd is not None:
+            test_case = os.path.join(cwd, test_case)
+
+        test = self.test_class([test_case], self.options)
+        test.stage_statistics = self.prototype.stage_statistics
+
+        if cwd is not None:
+            test.working_dir = cwd
+
+        return test
+
+class TestServerThread:
+    # Runs a TestServer on a Unix socket in a temporary directory for the
+    # duration of a with block
+    def __init__(self, test_class, options, max_tests=1):
+        self.test_class = test_class
+        self.options = options
+        self.max_tests = max_tests
+        self.tmp_dir = None
+        self.server = None
+        self.thread = None
+        self.address = None
+
+    @staticmethod
+    def is_supported():
+        return hasattr(socket, "AF_UNIX")
+
+    def __enter__(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="creduce_server.")
+        self.address = os.path.join(self.tmp_dir, "socket")
+        self.server = TestServer(self.address, self.test_class, self.options, self.max_tests)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
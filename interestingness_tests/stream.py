@@ -0,0 +1,307 @@
+import codecs
+import hashlib
+import json
+import re
+
+class OutputFingerprint:
+    # Output of a tool represented by the digests of fixed-size chunks. Equal
+    # outputs have equal fingerprints and the first differing chunk can be
+    # found without keeping either output in memory. Small outputs are also
+    # kept as a whole (head) to describe how they differ (see
+    # get_divergence); the head is not part of the identity.
+    chunk_size = 16 * 1024
+    head_size = 64 * 1024
+
+    def __init__(self, digests=None, size=0, head=None):
+        self.digests = digests if digests is not None else []
+        self.size = size
+        self.head = head
+
+    def __eq__(self, other):
+        if not isinstance(other, OutputFingerprint):
+            return NotImplemented
+
+        return self.size == other.size and self.digests == other.digests
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        return hash((self.size, tuple(self.digests)))
+
+    def __repr__(self):
+        return "OutputFingerprint(size={}, chunks={})".format(self.size, len(self.digests))
+
+    @staticmethod
+    def get_digest(chunk):
+        # Only has to tell chunks apart (BLAKE2 needs Python 3.6)
+        return hashlib.sha1(chunk).hexdigest()
+
+    @classmethod
+    def from_bytes(cls, data):
+        digests = [cls.get_digest(data[i:i + cls.chunk_size]) for i in range(0, len(data), cls.chunk_size)]
+        return cls(digests, len(data), bytes(data) if len(data) <= cls.head_size else None)
+
+    def to_json(self):
+        return {"digests" : self.digests, "size" : self.size}
+
+    @classmethod
+    def from_json(cls, value):
+        return cls(list(value["digests"]), int(value["size"]))
+
+# Values printed by cl_launcher (e.g. "0x2a,0x0,"), in contrast to error
+# messages or build logs
+_result_data_re = re.compile(rb"[0-9a-fA-FxX,\s]*")
+
+def is_result_data(chunk):
+    return _result_data_re.fullmatch(chunk) is not None
+
+class StreamComparator:
+    # Consumes the output of a tool chunk by chunk (see runner.Runner.run) and
+    # builds its fingerprint. If a reference fingerprint is available (it is
+    # looked up on every chunk since the oracle might be computed
+    # concurrently) the chunks are compared as they arrive. With
+    # stop_on_divergence the tool is stopped at the first differing chunk if
+    # it consists of result data. Otherwise the tool might be about to fail
+    # and has to run to completion to find out.
+    def __init__(self, get_reference=None, stop_on_divergence=False):
+        self.get_reference = get_reference
+        self.stop_on_divergence = stop_on_divergence
+        self.fingerprint = OutputFingerprint()
+        self.buffer = bytearray()
+        self.compared = 0
+        self.diverged = False
+        self.result_diverged = False
+        # Whether the complete chunks consist of result data
+        self.result_chunks = []
+        self.head = bytearray()
+
+    def _get_reference(self):
+        if self.get_reference is None:
+            return None
+
+        return self.get_reference()
+
+    def _compare(self, final=False):
+        reference = self._get_reference()
+
+        if reference is None or self.diverged:
+            return
+
+        digests = self.fingerprint.digests
+
+        while self.compared < len(digests):
+            if self.compared >= len(reference.digests) or digests[self.compared] != reference.digests[self.compared]:
+                self.diverged = True
+                self.result_diverged = self.result_chunks[self.compared]
+                return
+
+            self.compared += 1
+
+        if final and self.fingerprint != reference:
+            self.diverged = True
+
+    def feed(self, data):
+        # Returns False once the tool should be stopped
+        self.buffer.extend(data)
+        self.fingerprint.size += len(data)
+
+        if self.head is not None:
+            if self.fingerprint.size <= OutputFingerprint.head_size:
+                self.head.extend(data)
+            else:
+                self.head = None
+        chunk_size = OutputFingerprint.chunk_size
+
+        if len(self.buffer) >= chunk_size:
+            offset = 0
+
+            while len(self.buffer) - offset >= chunk_size:
+                chunk = bytes(self.buffer[offset:offset + chunk_size])
+                self.fingerprint.digests.append(OutputFingerprint.get_digest(chunk))
+                self.result_chunks.append(is_result_data(chunk))
+                offset += chunk_size
+
+            del self.buffer[:offset]
+            self._compare()
+
+        if self.result_diverged and self.stop_on_divergence:
+            # The output is incomplete once the tool is stopped
+            self.head = None
+            return False
+
+        return True
+
+    def close(self):
+        if self.buffer:
+            chunk = bytes(self.buffer)
+            self.fingerprint.digests.append(OutputFingerprint.get_digest(chunk))
+            self.result_chunks.append(is_result_data(chunk))
+            self.buffer = bytearray()
+
+        if self.head is not None:
+            self.fingerprint.head = bytes(self.head)
+
+        self._compare(final=True)
+
+        return self.fingerprint
+
+def is_diverged_early(output, reference):
+    # Whether a StreamComparator with stop_on_divergence would have stopped
+    # the tool, i.e. a complete chunk differs from the reference (the output
+    # of a successful run consists of result data)
+    for index in range(output.size // OutputFingerprint.chunk_size):
+        if index >= len(reference.digests) or output.digests[index] != reference.digests[index]:
+            return True
+
+    return False
+
+_value_separator_re = re.compile(rb"[\s,]+")
+
+def get_divergence(output, reference):
+    # Coarse description of how an output differs from the reference (see
+    # the bug signatures of WrongCodeBugOpenCLInterestingnessTest): "match",
+    # "length" if the number of values differs, "all" or "partial" if all or
+    # only some values differ, and "diverged" if the outputs are not known
+    # as a whole
+    if output == reference:
+        return "match"
+
+    if output.head is None or reference.head is None:
+        return "diverged"
+
+    values = _value_separator_re.split(output.head.strip())
+    reference_values = _value_separator_re.split(reference.head.strip())
+
+    if len(values) != len(reference_values):
+        return "length"
+
+    if all(value != reference_value for (value, reference_value) in zip(values, reference_values)):
+        return "all"
+
+    return "partial"
+
+_inner_re = re.compile(r'"inner"\s*:\s*\[')
+
+class MainFileASTFilter:
+    # Consumes the JSON AST dump of Clang (-ast-dump=json) and keeps only the
+    # top-level declarations of the main file. The dump of the included
+    # headers (e.g. clc.h) is much larger than the test case itself and is
+    # dropped declaration by declaration as it arrives. close() returns the
+    # translation unit with the kept declarations or None if the dump is not
+    # valid JSON.
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.buffer = ""
+        # Position in the buffer, None until the declarations of the
+        # translation unit start
+        self.position = None
+        # Available size of the last incomplete declaration
+        self.retry_size = 0
+        self.done = False
+        self.valid = True
+        self.declarations = []
+        # Clang only prints the file of a location (and where it has been
+        # included from) if it differs from the previous location
+        self.main_file = True
+
+    def _update_file(self, node):
+        # Walks the locations in the order they have been printed
+        if isinstance(node, dict):
+            if isinstance(node.get("file"), str):
+                self.main_file = "includedFrom" not in node
+
+            for (key, value) in node.items():
+                # The including file is not a location of its own
+                if key != "includedFrom":
+                    self._update_file(value)
+        elif isinstance(node, list):
+            for value in node:
+                self._update_file(value)
+
+    def _add(self, node, text):
+        if '"file"' not in text:
+            # No location changes the file
+            main_file = self.main_file
+            begin = node.get("range", {}).get("begin", {})
+        else:
+            main_file = None
+
+            for (key, value) in node.items():
+                if key == "range" and isinstance(value, dict):
+                    begin = value.get("begin", {})
+                    self._update_file(begin)
+                    main_file = self.main_file
+                    self._update_file(value.get("end", {}))
+                else:
+                    self._update_file(value)
+
+        # Implicit declarations have no location
+        if main_file and begin:
+            self.declarations.append(node)
+
+    def _parse(self, final=False):
+        if self.position is None:
+            match = _inner_re.search(self.buffer)
+
+            if match is None:
+                return
+
+            self.position = match.end()
+
+        while not self.done:
+            position = self.position
+
+            while position < len(self.buffer) and self.buffer[position] in " \t\r\n,":
+                position += 1
+
+            self.position = position
+
+            if position == len(self.buffer):
+                break
+
+            if self.buffer[position] == "]":
+                self.done = True
+                break
+
+            # Large declarations are only decoded again once the available
+            # part of them has doubled
+            if not final and len(self.buffer) - position < self.retry_size:
+                break
+
+            try:
+                (node, end) = self.decoder.raw_decode(self.buffer, position)
+            except ValueError:
+                if final:
+                    self.valid = False
+
+                self.retry_size = 2 * (len(self.buffer) - position)
+                break
+
+            self._add(node, self.buffer[position:end])
+            self.retry_size = 0
+            self.position = end
+
+        # The parsed part of the buffer is not needed anymore
+        if self.position:
+            self.buffer = self.buffer[self.position:]
+            self.position = 0
+
+    def feed(self, data):
+        if not self.done:
+            self.buffer += self.text_decoder.decode(data)
+            self._parse()
+
+        return True
+
+    def close(self):
+        if not self.done:
+            self.buffer += self.text_decoder.decode(b"", final=True)
+            self._parse(final=True)
+
+        if not self.valid or not self.done:
+            return None
+
+        return {"kind" : "TranslationUnitDecl", "inner" : self.declarations}
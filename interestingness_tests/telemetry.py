@@ -0,0 +1,95 @@
+from interestingness_tests import jsonl
+import os
+
+# Every interestingness check appends one JSON line to the telemetry file of
+# the reduction. The event contains the outcome and runtime of the check, of
+# each of its stages and of every tool invocation.
+
+def append_event(path, event):
+    # The parallel tests of C-Reduce share the file
+    jsonl.append_record(path, event)
+
+def read_events(path):
+    return jsonl.read_records(path)
+
+def find_telemetry_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for (root, _, files) in os.walk(path):
+                for name in sorted(files):
+                    if name.endswith(".telemetry.jsonl"):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+class Report:
+    # Aggregates the telemetry of a whole campaign
+    def __init__(self):
+        self.files = 0
+        self.checks = 0
+        self.check_time = 0.0
+        self.first_start = None
+        self.last_end = None
+        self.outcomes = dict()
+        self.tools = dict()
+        self.stages = dict()
+
+    def add_event(self, event):
+        self.checks += 1
+        self.check_time += event["duration"]
+        self.outcomes[event["outcome"]] = self.outcomes.get(event["outcome"], 0) + 1
+
+        start = event["time"]
+        end = start + event["duration"]
+        self.first_start = start if self.first_start is None else min(self.first_start, start)
+        self.last_end = end if self.last_end is None else max(self.last_end, end)
+
+        for tool in event.get("tools", []):
+            entry = self.tools.setdefault(tool["tool"], {"runs" : 0, "time" : 0.0, "cpu_time" : 0.0, "max_rss" : 0, "timeouts" : 0})
+            entry["runs"] += 1
+            entry["time"] += tool["duration"]
+            entry["cpu_time"] += tool["cpu_time"] or 0.0
+            entry["max_rss"] = max(entry["max_rss"], tool["max_rss"] or 0)
+            entry["timeouts"] += int(tool["outcome"] == "timeout")
+
+        for stage in event.get("stages", []):
+            entry = self.stages.setdefault(stage["stage"], {"runs" : 0, "time" : 0.0, "rejections" : dict()})
+            entry["runs"] += 1
+            entry["time"] += stage["duration"]
+
+            if stage["outcome"] == "rejected":
+                reason = stage["reason"] or "unknown"
+                entry["rejections"][reason] = entry["rejections"].get(reason, 0) + 1
+
+    def add_file(self, path):
+        self.files += 1
+
+        for event in read_events(path):
+            self.add_event(event)
+
+    def format(self):
+        lines = []
+        wall_time = (self.last_end - self.first_start) if self.checks else 0.0
+
+        lines.append("Telemetry files: {}".format(self.files))
+        lines.append("Checks: {} in {:.1f} s of test time ({:.1f} s wall time, {:.2f} checks/s)".format(self.checks, self.check_time, wall_time, self.checks / wall_time if wall_time > 0 else 0.0))
+
+        for (outcome, count) in sorted(self.outcomes.items(), key=lambda item: -item[1]):
+            lines.append("    {:<24} {:>8}".format(outcome, count))
+
+        lines.append("")
+        lines.append("{:<24} {:>8} {:>12} {:>12} {:>10} {:>10}".format("Tool", "Runs", "Time [s]", "CPU [s]", "RSS [MiB]", "Timeouts"))
+
+        for (tool, entry) in sorted(self.tools.items(), key=lambda item: -item[1]["time"]):
+            lines.append("{:<24} {:>8} {:>12.1f} {:>12.1f} {:>10.1f} {:>10}".format(tool, entry["runs"], entry["time"], entry["cpu_time"], entry["max_rss"] / (1024 * 1024), entry["timeouts"]))
+
+        lines.append("")
+        lines.append("{:<24} {:>8} {:>12} {:>10}".format("Stage", "Runs", "Time [s]", "Rejected"))
+
+        for (stage, entry) in sorted(self.stages.items(), key=lambda item: -item[1]["time"]):
+            lines.append("{:<24} {:>8} {:>12.1f} {:>10}".format(stage, entry["runs"], entry["time"], sum(entry["rejections"].values())))
+
+            for (reason, count) in sorted(entry["rejections"].items(), key=lambda item: -item[1]):
+                lines.append("    {:<44} {:>10}".format(reason, count))
+
+        return "\n".join(lines)
@@ -0,0 +1,98 @@
+from interestingness_tests import tokenizer
+import hashlib
+import re
+
+_work_sizes_re = re.compile(r"//(.*) -g ([0-9]+),([0-9]+),([0-9]+) -l ([0-9]+),([0-9]+),([0-9]+)\n")
+
+class TestCase:
+    # A test case file which is read and hashed at most once. Everything
+    # derived from the content (work sizes, tokens, normalised hash) is
+    # computed on first use and shared by all checks of the test case. The
+    # file must not be changed while the object is in use.
+    __slots__ = ["path", "_data", "_content", "_digest", "_work_sizes", "_tokens", "_normalised_hash"]
+
+    def __init__(self, path, data=None):
+        self.path = path
+        self._data = data
+        self._content = None
+        self._digest = None
+        self._work_sizes = None
+        self._tokens = None
+        self._normalised_hash = None
+
+    def __repr__(self):
+        return "TestCase({!r})".format(self.path)
+
+    @classmethod
+    def get(cls, test_case):
+        # Accepts a path or an existing test case
+        if isinstance(test_case, cls):
+            return test_case
+
+        return cls(test_case)
+
+    @classmethod
+    def write(cls, path, content):
+        # Writes the file and keeps the content so that it is not read again
+        data = content.encode()
+
+        with open(path, "wb") as test_file:
+            test_file.write(data)
+
+        return cls(path, data)
+
+    def get_data(self):
+        if self._data is None:
+            with open(self.path, "rb") as test_file:
+                self._data = test_file.read()
+
+        return self._data
+
+    def get_content(self):
+        if self._content is None:
+            self._content = self.get_data().decode(errors="replace")
+
+        return self._content
+
+    def get_digest(self):
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.get_data()).digest()
+
+        return self._digest
+
+    def get_hash(self):
+        return self.get_digest().hex()
+
+    def get_header(self):
+        return tokenizer.get_header(self.get_content())
+
+    def get_work_sizes(self):
+        # Returns (meta information, global work size, local work size, content
+        # without the header) or None if the header is missing
+        if self._work_sizes is None:
+            m = _work_sizes_re.match(self.get_content())
+
+            if m is None:
+                self._work_sizes = (None, None, None, None)
+            else:
+                self._work_sizes = (m.group(1),
+                                    tuple(int(s) for s in m.group(2, 3, 4)),
+                                    tuple(int(s) for s in m.group(5, 6, 7)),
+                                    self.get_content()[m.end():])
+
+        if self._work_sizes[0] is None:
+            return None
+
+        return self._work_sizes
+
+    def get_tokens(self):
+        if self._tokens is None:
+            self._tokens = list(tokenizer.tokenize(self.get_content()))
+
+        return self._tokens
+
+    def get_normalised_hash(self):
+        if self._normalised_hash is None:
+            self._normalised_hash = tokenizer.get_tokens_hash(self.get_header(), self.get_tokens())
+
+        return self._normalised_hash
@@ -0,0 +1,51 @@
+import hashlib
+import re
+
+_token_re = re.compile(r"""
+    (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<directive>\#(?:\\\n|[^\n])*)
+  | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+  | (?P<identifier>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<number>\.?[0-9](?:[eEpP][+-]|[A-Za-z0-9_.])*)
+  | (?P<space>\s+)
+  | (?P<punctuator>>>=|<<=|\.\.\.|->|\+\+|--|<<|>>|<=|>=|==|!=|&&|\|\||[-+*/%&|^]=|\#\#|.)
+""", re.VERBOSE | re.DOTALL)
+
+_header_re = re.compile(r"//.* -g [0-9]+,[0-9]+,[0-9]+ -l [0-9]+,[0-9]+,[0-9]+")
+
+def tokenize(content):
+    for m in _token_re.finditer(content):
+        kind = m.lastgroup
+
+        if kind == "space" or kind == "comment":
+            continue
+
+        if kind == "directive":
+            # Whitespace inside of directives is not significant either
+            yield (kind, " ".join(m.group().replace("\\\n", " ").split()))
+        else:
+            yield (kind, m.group())
+
+def get_header(content):
+    # The cl_launcher options (including the work sizes) are stored in the
+    # first line comment and therefore are not part of the token stream
+    m = _header_re.match(content)
+
+    if m is None:
+        return ""
+
+    return m.group()
+
+def get_tokens_hash(header, tokens):
+    digest = hashlib.sha256()
+    digest.update(header.encode())
+    digest.update(b"\n")
+
+    for (_, token) in tokens:
+        digest.update(token.encode())
+        digest.update(b"\n")
+
+    return digest.hexdigest()
+
+def get_normalised_hash(content):
+    return get_tokens_hash(get_header(content), tokenize(content))
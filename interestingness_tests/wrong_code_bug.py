@@ -3,6 +3,8 @@
 from enum import Enum
 from interestingness_tests import base
 from interestingness_tests import opencl
+from interestingness_tests import stream
+import concurrent.futures
 import os
 import sys
 
@@ -54,89 +56,215 @@ class WrongCodeBugOpenCLInterestingnessTest(opencl.OpenCLInterestingnessTest):
             self.optimisation_level = self.OptimisationLevel.either
 
         self.check_static = self.options["check_static"]
+        # If set the runs which have not been needed for an interesting
+        # verdict are still completed by the check (see get_signature)
+        self.collect_signature = False
+        # Results of the last check
+        self.results = None
+        self.oracle_output = None
 
-    def check(self):
-        if self.check_static:
-            if not self.is_valid_cl_launcher_test_case(self.test_case):
-                raise base.InvalidTestCaseError("cl_launcher")
+    def _get_output(self, results, name):
+        proc = results.get(name)
 
-            if not self.is_statically_valid(self.test_case, self.timeout):
-                raise base.InvalidTestCaseError("static")
+        # A run is only stopped once result data diverged from the oracle
+        # (see stream.StreamComparator), hence the kernel finished
+        if proc is None or (proc.returncode != 0 and not proc.stopped):
+            raise base.InvalidTestCaseError(name)
 
-        if self.use_oracle:
-            # Implicitly checks if test case is valid in Oclgrind
-            oracle = self.get_oracle_result(self.test_case, self.timeout)
+        return proc.stdout
 
-            if oracle is None:
-                raise base.InvalidTestCaseError("oracle")
+    def get_stop_on_divergence(self, optimised):
+        # Whether the first difference to the oracle settles the verdict
+        if not self.use_oracle:
+            return False
 
-            if self.optimisation_level is self.OptimisationLevel.optimised:
-                proc_opt = self._run_cl_launcher(self.test_case, self.platform, self.device, self.timeout, optimised=True)
+        if self.optimisation_level is self.OptimisationLevel.optimised:
+            return optimised
+        elif self.optimisation_level is self.OptimisationLevel.unoptimised:
+            return not optimised
+        elif self.optimisation_level is self.OptimisationLevel.either:
+            return True
 
-                if proc_opt is None or proc_opt.returncode != 0:
-                    raise base.InvalidTestCaseError("optimised")
+        return False
 
-                return proc_opt.stdout != oracle
-            elif self.optimisation_level is self.OptimisationLevel.unoptimised:
-                proc_unopt = self._run_cl_launcher(self.test_case, self.platform, self.device, self.timeout, optimised=False)
+    def get_run_names(self):
+        # Runs of cl_launcher on every device
+        names = []
 
-                if proc_unopt is None or proc_unopt.returncode != 0:
-                    raise base.InvalidTestCaseError("unoptimised")
+        if not self.use_oracle or self.optimisation_level is not self.OptimisationLevel.unoptimised:
+            names.append("optimised")
 
-                return proc_unopt.stdout != oracle
-            elif self.optimisation_level is self.OptimisationLevel.either:
-                proc_opt = self._run_cl_launcher(self.test_case, self.platform, self.device, self.timeout, optimised=True)
+        if not self.use_oracle or self.optimisation_level is not self.OptimisationLevel.optimised:
+            names.append("unoptimised")
 
-                if proc_opt is None or proc_opt.returncode != 0:
-                    raise base.InvalidTestCaseError("optimised")
+        return names
 
-                if proc_opt.stdout != oracle:
-                    return True
+    def get_run_divergence(self, results, name, reference, stop_on_divergence=False):
+        if not results.is_done(name):
+            return "unknown"
 
-                proc_unopt = self._run_cl_launcher(self.test_case, self.platform, self.device, self.timeout, optimised=False)
+        try:
+            output = self._get_output(results, name)
+        except (base.InvalidTestCaseError, base.TestTimeoutError, concurrent.futures.CancelledError):
+            return "unknown"
 
-                if proc_unopt is None or proc_unopt.returncode != 0:
-                    raise base.InvalidTestCaseError("unoptimised")
+        if reference is None:
+            return "unknown"
 
-                if proc_unopt.stdout != oracle:
-                    return True
+        # Whether a run has been stopped depends on when the oracle became
+        # available, hence all runs which could have been stopped are alike
+        if results.get(name).stopped or (stop_on_divergence and stream.is_diverged_early(output, reference)):
+            return "diverged"
 
-                return False
-            elif self.optimisation_level is self.OptimisationLevel.all:
-                proc_opt = self._run_cl_launcher(self.test_case, self.platform, self.device, self.timeout, optimised=True)
+        return stream.get_divergence(output, reference)
+
+    def get_signature(self):
+        # Describes on which devices which runs diverge (and how) in the last
+        # interesting check. Test cases with the same signature most likely
+        # trigger the same bug. The signature is only complete if the check
+        # has been run with collect_signature, otherwise the runs which the
+        # verdict did not need are unknown.
+        if self.results is None:
+            return None
+
+        signature = dict()
 
-                if proc_opt is None or proc_opt.returncode != 0:
-                    raise base.InvalidTestCaseError("optimised")
+        for device in self.devices:
+            results = self.get_device_results(self.results, device, ["optimised", "unoptimised"])
 
-                if proc_opt.stdout == oracle:
-                    return False
+            if self.use_oracle:
+                runs = {name : self.get_run_divergence(results, name, self.oracle_output, self.get_stop_on_divergence(name == "optimised")) for name in self.get_run_names()}
+            else:
+                try:
+                    reference = self._get_output(results, "unoptimised") if results.is_done("unoptimised") else None
+                except (base.InvalidTestCaseError, base.TestTimeoutError, concurrent.futures.CancelledError):
+                    reference = None
 
-                proc_unopt = self._run_cl_launcher(self.test_case, self.platform, self.device, self.timeout, optimised=False)
+                runs = {"optimised" : self.get_run_divergence(results, "optimised", reference)}
 
-                if proc_unopt is None or proc_unopt.returncode != 0:
-                    raise base.InvalidTestCaseError("unoptimised")
+            signature["{},{}".format(*device)] = runs
 
-                if proc_unopt.stdout == oracle:
-                    return False
+        return {"optimisation_level" : self.optimisation_level.value, "use_oracle" : self.use_oracle, "devices" : signature}
+
+    def get_validation_stages(self):
+        stages = []
+
+        if self.check_static:
+            stages.extend(self.get_static_stages(self.test_case, self.timeout))
+
+        if self.use_oracle:
+            stages.append(self.get_oracle_stage(self.test_case, self.timeout))
 
+        return stages
+
+    def decide_against_oracle(self, results, oracle):
+        if self.optimisation_level is self.OptimisationLevel.optimised:
+            return self._get_output(results, "optimised") != oracle
+        elif self.optimisation_level is self.OptimisationLevel.unoptimised:
+            return self._get_output(results, "unoptimised") != oracle
+        elif self.optimisation_level is self.OptimisationLevel.either:
+            if self._get_output(results, "optimised") != oracle:
                 return True
-        else:
-            #FIXME: Need to run both?
-            if (not self.is_valid_oclgrind(self.test_case, self.timeout, optimised=True) or
-                not self.is_valid_oclgrind(self.test_case, self.timeout, optimised=False)):
+
+            if self._get_output(results, "unoptimised") != oracle:
+                return True
+
+            return False
+        elif self.optimisation_level is self.OptimisationLevel.all:
+            # Early bailout if the unoptimised result is already known to
+            # match the oracle (only happens for concurrent evaluation)
+            if results.is_done("unoptimised"):
+                try:
+                    if self._get_output(results, "unoptimised") == oracle:
+                        return False
+                except (base.InvalidTestCaseError, base.TestTimeoutError):
+                    pass
+
+            if self._get_output(results, "optimised") == oracle:
                 return False
 
-            proc_opt = self._run_cl_launcher(self.test_case, self.platform, self.device, self.timeout, optimised=True)
+            if self._get_output(results, "unoptimised") == oracle:
+                return False
+
+            return True
 
-            if proc_opt is None or proc_opt.returncode != 0:
-                raise base.InvalidTestCaseError("optimised")
+    def decide_differential(self, results):
+        #FIXME: Need to run both?
+        for name in ["oclgrind_optimised", "oclgrind_unoptimised"]:
+            if results.is_done(name) and not results.get(name):
+                return False
 
-            proc_unopt = self._run_cl_launcher(self.test_case, self.platform, self.device, self.timeout, optimised=False)
+        if (not results.get("oclgrind_optimised") or
+            not results.get("oclgrind_unoptimised")):
+            return False
 
-            if proc_unopt is None or proc_unopt.returncode != 0:
-                raise base.InvalidTestCaseError("unoptimised")
+        output_opt = self._get_output(results, "optimised")
+        output_unopt = self._get_output(results, "unoptimised")
 
-            return proc_opt.stdout != proc_unopt.stdout
+        return output_opt != output_unopt
+
+    def check(self):
+        if self.cancelled:
+            raise base.InvalidTestCaseError("cancelled")
+
+        # The conservative checks of the syntax are only part of the static
+        # checks, the structural ones are always run
+        self.check_syntax(self.test_case, self.check_static and self.conservative)
+        self.results = None
+        self.oracle_output = None
+
+        with self.get_evaluator() as evaluator:
+            # Independent validity checks are run in the learned order
+            stages = self.submit_stages(evaluator, self.get_validation_stages())
+
+            if not self.use_oracle:
+                evaluator.submit("oclgrind_optimised", self.is_valid_oclgrind, self.test_case, self.timeout, optimised=True)
+                evaluator.submit("oclgrind_unoptimised", self.is_valid_oclgrind, self.test_case, self.timeout, optimised=False)
+
+            if self.use_oracle:
+                oracle_stage = next(stage for stage in stages if stage.name == "oracle")
+
+                # The oracle might only become available while the device runs
+                def get_reference():
+                    return oracle_stage.oracle["output"] if oracle_stage.oracle is not None else None
+            else:
+                get_reference = None
+
+            # All devices are run against the same oracle
+            for device in self.devices:
+                (platform, device_number) = device
+
+                for name in self.get_run_names():
+                    optimised = (name == "optimised")
+                    evaluator.submit(self.get_device_run_name(name, device), self._run_cl_launcher, self.test_case, platform, device_number, self.timeout, optimised=optimised,
+                                     get_reference=get_reference, stop_on_divergence=self.get_stop_on_divergence(optimised))
+
+            def decide_device(results):
+                if self.use_oracle:
+                    return self.decide_against_oracle(results, oracle_stage.oracle["output"])
+                else:
+                    return self.decide_differential(results)
+
+            def decide(results):
+                self.validate_stages(results, stages)
+
+                return self.decide_devices(lambda device: decide_device(self.get_device_results(results, device, ["optimised", "unoptimised"])))
+
+            try:
+                interesting = evaluator.evaluate(decide)
+            finally:
+                self.record_stages(evaluator, stages)
+
+            # Both evaluators complete the same runs so that the signature
+            # does not depend on the timing of the check
+            if interesting and self.collect_signature:
+                evaluator.wait([self.get_device_run_name(name, device) for device in self.devices for name in self.get_run_names()])
+
+            if interesting:
+                self.results = evaluator
+                self.oracle_output = oracle_stage.oracle["output"] if self.use_oracle else None
+
+            return interesting
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
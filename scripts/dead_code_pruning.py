@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+
+import interestingness_tests
+from interestingness_tests import tokenizer
+
+# Only these top-level declarations are removed. Struct fields are kept since
+# removing them would break the positional initialisers of CLSmith.
+_prunable_kinds = {"FunctionDecl", "VarDecl", "RecordDecl", "TypedefDecl", "EnumDecl"}
+
+# Keys of AST nodes which refer to another declaration
+_reference_keys = {"referencedDecl", "ownedTagDecl", "decl"}
+
+def get_location(loc):
+    # Declarations produced by a macro are located at the expansion
+    return loc.get("expansionLoc", loc)
+
+def is_main_file(loc):
+    return "includedFrom" not in get_location(loc)
+
+def get_references(node, references):
+    # Names of all declarations and types used in the subtree of the node
+    if isinstance(node, dict):
+        for (key, value) in node.items():
+            if key in _reference_keys and isinstance(value, dict) and "name" in value:
+                references.add(value["name"])
+            elif key in ("qualType", "desugaredQualType") and isinstance(value, str):
+                references.update(token for (kind, token) in tokenizer.tokenize(value) if kind == "identifier")
+            else:
+                get_references(value, references)
+    elif isinstance(node, list):
+        for value in node:
+            get_references(value, references)
+
+    return references
+
+class Declaration:
+    # One or more top-level declarations with overlapping source ranges, e.g.
+    # a struct definition and the variable declared with it
+    def __init__(self, begin, end):
+        self.begin = begin
+        self.end = end
+        self.names = set()
+        self.references = set()
+        self.root = False
+
+    def add(self, node, begin, end):
+        self.begin = min(self.begin, begin)
+        self.end = max(self.end, end)
+
+        inner = node.get("inner", [])
+        names = [node.get("name")]
+        # Enumerators are referenced by their own names
+        names.extend(child.get("name") for child in inner if child.get("kind") == "EnumConstantDecl")
+        self.names.update(name for name in names if name)
+        get_references(node, self.references)
+
+        # Kernels are the entry points. Declarations which are not understood
+        # are always kept.
+        if (node.get("kind") not in _prunable_kinds or
+            not node.get("name") or
+            any(child.get("kind") == "OpenCLKernelAttr" for child in inner)):
+            self.root = True
+
+def get_declarations(ast, size):
+    # Top-level declarations of the main file ordered by their position
+    nodes = []
+
+    for node in ast.get("inner", []):
+        if node.get("isImplicit"):
+            continue
+
+        source_range = node.get("range", {})
+        begin = get_location(source_range.get("begin", {}))
+        end = get_location(source_range.get("end", {}))
+
+        if not is_main_file(source_range.get("begin", {})) or "offset" not in begin or "offset" not in end:
+            continue
+
+        end_offset = end["offset"] + end.get("tokLen", 0)
+
+        if end_offset > size:
+            continue
+
+        nodes.append((begin["offset"], end_offset, node))
+
+    declarations = []
+
+    for (begin, end, node) in sorted(nodes, key=lambda entry: entry[0]):
+        if not declarations or begin >= declarations[-1].end:
+            declarations.append(Declaration(begin, end))
+
+        declarations[-1].add(node, begin, end)
+
+    return declarations
+
+def find_dead_declarations(declarations):
+    # Declarations which can not be reached from a kernel
+    by_name = dict()
+
+    for declaration in declarations:
+        for name in declaration.names:
+            by_name.setdefault(name, []).append(declaration)
+
+    reached = set()
+    work_list = [declaration for declaration in declarations if declaration.root]
+
+    while work_list:
+        declaration = work_list.pop()
+
+        if id(declaration) in reached:
+            continue
+
+        reached.add(id(declaration))
+
+        for name in declaration.references:
+            work_list.extend(by_name.get(name, []))
+
+    return [declaration for declaration in declarations if id(declaration) not in reached]
+
+def remove_declarations(data, declarations):
+    # Removes the declarations (including the terminating semicolon)
+    chunks = []
+    offset = 0
+
+    for declaration in declarations:
+        end = declaration.end
+
+        while end < len(data) and data[end:end + 1].isspace():
+            end += 1
+
+        if data[end:end + 1] == b";":
+            end += 1
+        else:
+            end = declaration.end
+
+        # Declarations on lines of their own are removed with the line break
+        if (declaration.begin == 0 or data[declaration.begin - 1:declaration.begin] == b"\n") and data[end:end + 1] == b"\n":
+            end += 1
+
+        chunks.append(data[offset:declaration.begin])
+        offset = end
+
+    chunks.append(data[offset:])
+
+    return b"".join(chunks)
+
+class DeadDeclarationPruner:
+    # Removes the top-level functions, variables and types which are not
+    # reachable from a kernel. The references are taken from the AST dump of
+    # Clang (see OpenCLInterestingnessTest.get_ast).
+    def __init__(self, test_case, test):
+        self.test_case = interestingness_tests.TestCase.get(test_case)
+        self.test = test
+        # Number of removed declarations (None if the AST is not available)
+        self.pruned = None
+
+    def get_pruned_content(self):
+        # Returns the content without the dead declarations or None if the
+        # AST is not available
+        try:
+            ast = self.test.get_ast(self.test_case, self.test.timeout)
+        except interestingness_tests.TestTimeoutError:
+            return None
+
+        if ast is None:
+            return None
+
+        data = self.test_case.get_data()
+        dead = find_dead_declarations(get_declarations(ast, len(data)))
+        self.pruned = len(dead)
+
+        return remove_declarations(data, dead).decode(errors="replace")
+
+    def run(self, path):
+        # Writes the pruned test case to path and returns True if it is still
+        # interesting
+        content = self.get_pruned_content()
+
+        if content is None or not self.pruned:
+            return False
+
+        path = os.path.abspath(path)
+        test_case = interestingness_tests.TestCase.write(path, content)
+        test = self.test.__class__([test_case], self.test.options)
+        test.stage_statistics = self.test.stage_statistics
+        # The tools leave their files (e.g. object files) in the working
+        # directory
+        test.working_dir = tempfile.mkdtemp(prefix=os.path.splitext(os.path.basename(path))[0] + ".", dir=os.path.dirname(path))
+
+        try:
+            return bool(test.run_check())
+        except (interestingness_tests.TestTimeoutError, interestingness_tests.InvalidTestCaseError):
+            return False
+        finally:
+            shutil.rmtree(test.working_dir, ignore_errors=True)
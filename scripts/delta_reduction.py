@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import interestingness_tests
+import speculation
+from interestingness_tests import tokenizer
+
+_opening = {"(", "[", "{"}
+_closing = {")", "]", "}"}
+
+def get_lines(content):
+    return content.splitlines(True)
+
+def get_declarations(lines):
+    # Groups the lines into top-level declarations (and directives). A
+    # declaration ends with the first line after which all brackets are
+    # closed and which ends with ";" or "}".
+    declarations = []
+    current = []
+    depth = 0
+
+    for line in lines:
+        current.append(line)
+        last = None
+
+        for (kind, token) in tokenizer.tokenize(line):
+            if token in _opening:
+                depth += 1
+            elif token in _closing:
+                depth -= 1
+
+            last = (kind, token)
+
+        if last is None:
+            continue
+
+        if depth <= 0 and (last[0] == "directive" or last[1] in (";", "}")):
+            declarations.append("".join(current))
+            current = []
+            depth = 0
+
+    if current:
+        declarations.append("".join(current))
+
+    return declarations
+
+class DeltaReducer:
+    # Coarse pre-reduction of a test case by delta debugging (ddmin over
+    # complements). The test case is first reduced at the granularity of
+    # top-level declarations and then at the granularity of lines. In every
+    # round the units are split into n chunks and the variants without one of
+    # the chunks are tested concurrently (see speculation.CandidateTester).
+    # The first interesting variant is kept, otherwise the chunks are halved.
+    # The work size comment in the first line is never removed.
+    def __init__(self, test_case, test, jobs=1):
+        self.test_case = interestingness_tests.TestCase.get(test_case)
+        self.test = test
+        self.jobs = max(1, jobs)
+        self.tester = speculation.CandidateTester(self.test_case, test, self.__format_test_case, self.jobs)
+        self.verdicts = self.tester.verdicts
+
+        lines = get_lines(self.test_case.get_content())
+
+        if lines and self.test_case.get_header():
+            self.header = lines.pop(0)
+        else:
+            self.header = ""
+
+        self.lines = lines
+
+    def __format_test_case(self, units):
+        return self.header + "".join(units)
+
+    def __ddmin(self, units):
+        n = 2
+        # Index of the chunk which has been removed last. The next round
+        # starts there since earlier chunks have already been tried.
+        start = 0
+
+        while len(units) >= 2:
+            bounds = [len(units) * i // n for i in range(0, n + 1)]
+            chunks = list(zip(bounds[:-1], bounds[1:]))
+            start = min(start, len(chunks) - 1)
+            chunks = chunks[start:] + chunks[:start]
+            candidates = [tuple(units[:low] + units[high:]) for (low, high) in chunks]
+            index = self.tester.find_first(candidates)
+
+            if index is not None:
+                units = list(candidates[index])
+                start = (start + index) % n
+                n = max(n - 1, 2)
+            elif n < len(units):
+                n = min(2 * n, len(units))
+                start = 0
+            else:
+                break
+
+        return units
+
+    def run(self):
+        # Returns True if the test case has been reduced
+        units = self.__ddmin(get_declarations(self.lines))
+        units = self.__ddmin(get_lines("".join(units)))
+
+        if units == self.lines:
+            return False
+
+        self.test_case = interestingness_tests.TestCase.write(self.test_case.path, self.__format_test_case(units))
+        self.lines = units
+
+        return True
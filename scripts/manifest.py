@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import time
+
+from interestingness_tests import jsonl
+
+def get_hash(path=None, params=None):
+    digest = hashlib.sha256()
+
+    if path is not None:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+
+    if params is not None:
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+
+    return digest.hexdigest()
+
+class Manifest:
+    # JSON lines file with one record per test case and stage (status, hashes
+    # of input and output, runtime and failure reason). Records are appended
+    # with a single write so that parallel workers can share the file.
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.records = dict()
+
+    def load(self):
+        self.records = dict()
+
+        if not os.path.exists(self.path):
+            return
+
+        for record in jsonl.read_records(self.path):
+            self.records[(record["test_case"], record["stage"])] = record
+
+    def find(self, test_case, stage, input_hash):
+        record = self.records.get((test_case, stage))
+
+        if record is None or record["input_hash"] != input_hash:
+            return None
+
+        # Outputs of successful stages must still be unchanged
+        if record["status"] == "ok" and record["output"] is not None:
+            if not os.path.isfile(record["output"]) or get_hash(record["output"]) != record["output_hash"]:
+                return None
+
+        return record
+
+    def record(self, test_case, stage, status, input_hash, output=None, start=None, reason=None):
+        record = {"test_case" : test_case,
+                  "stage" : stage,
+                  "status" : status,
+                  "input_hash" : input_hash,
+                  "output" : os.path.abspath(output) if output is not None else None,
+                  "output_hash" : get_hash(output) if output is not None and os.path.isfile(output) else None,
+                  "runtime" : round(time.monotonic() - start, 3) if start is not None else None,
+                  "reason" : reason,
+                  "time" : time.time()}
+
+        self.records[(test_case, stage)] = record
+        jsonl.append_record(self.path, record)
+
+        return record
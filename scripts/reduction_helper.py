@@ -2,18 +2,34 @@
 
 import argparse
 import atexit
+import concurrent.futures
+import contextlib
 import fileinput
+import functools
+import io
+import json
 import interestingness_tests
+import multiprocessing
 import os
 import pathlib
 import platform
+import queue
 import re
 import shutil
 import subprocess
 import sys
 import tempfile
+import threading
 import time
+import dead_code_pruning
+import delta_reduction
+import manifest
+import scheduling
+import signatures
+import work_queue
 import work_size_reduction
+from interestingness_tests import server
+from interestingness_tests import telemetry
 
 def which(cmd, must_exist=False):
     if os.path.isfile(cmd) and os.access(cmd, os.F_OK):
@@ -52,6 +68,9 @@ def get_test_class(test_str):
         print("Unknown interestingness test")
         sys.exit(1)
 
+def get_test_client_file():
+    return os.path.join(os.path.dirname(interestingness_tests.__file__), "client.py")
+
 def get_test_script_file(test_str):
     if test_str is None:
         print("Missing --test argument")
@@ -63,6 +82,585 @@ def get_test_script_file(test_str):
         print("Unknown interestingness test")
         sys.exit(1)
 
+class JobBudget:
+    # Number of jobs (tool processes) which may run at the same time across
+    # all test cases processed in parallel. A stage has to acquire as many
+    # jobs as it runs in parallel itself, e.g. C-Reduce acquires --n jobs.
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.semaphore = multiprocessing.Semaphore(jobs)
+        self.lock = multiprocessing.Lock()
+
+    @contextlib.contextmanager
+    def acquire(self, jobs=1):
+        jobs = max(1, min(jobs, self.jobs))
+
+        # Acquire all jobs at once to avoid a deadlock between stages which
+        # have only acquired part of their jobs
+        with self.lock:
+            for _ in range(jobs):
+                self.semaphore.acquire()
+
+        try:
+            yield jobs
+        finally:
+            for _ in range(jobs):
+                self.semaphore.release()
+
+def get_test_jobs():
+    return max(1, int(os.environ.get("CREDUCE_TEST_JOBS", 1)))
+
+def get_test_fingerprint(args):
+    # Test options which influence the outcome of a stage
+    test_class = get_test_class(args.test)
+    options = test_class.get_test_options(os.environ)
+
+    return {"test" : args.test,
+            "options" : {k : v for (k, v) in options.items() if k not in test_class.cache_independent_options}}
+
+def get_telemetry_file(test_case_name):
+    return os.path.abspath("{}.telemetry.jsonl".format(test_case_name))
+
+def get_test_options(test_class, test_case_name):
+    # All checks of a test case are recorded in the same telemetry file
+    options = test_class.get_test_options(os.environ)
+    options["telemetry"] = get_telemetry_file(test_case_name)
+
+    return options
+
+def resume_stage(args, test_case_name, stage, input_hash, log_file):
+    # Returns the record of the stage if it has already been completed for
+    # the same input in a previous run
+    if not args.resume:
+        return None
+
+    record = _manifest.find(test_case_name, stage, input_hash)
+
+    if record is None:
+        return None
+
+    if record["status"] == "ok":
+        if args.verbose:
+            print("-> {} resumed".format(stage), end=" ", flush=True, file=log_file)
+    else:
+        print("-> {} (resumed)".format(record["reason"]), file=log_file)
+
+    return record
+
+def calibrate_timeouts(args, test_case_path, test_case_name, timeouts_path):
+    # Baseline runtimes are only measured again if the test case has changed
+    try:
+        with open(timeouts_path, "r") as timeouts_file:
+            if json.load(timeouts_file).get("test_case") == manifest.get_hash(test_case_path):
+                return
+    except (OSError, ValueError):
+        pass
+
+    test_class = get_test_class(args.test)
+    options = get_test_options(test_class, test_case_name)
+    options["timeouts"] = None
+    test = test_class([test_case_path], options)
+
+    with _budget.acquire(get_test_jobs()):
+        test.calibrate_timeouts(timeouts_path)
+
+_budget = None
+_manifest = None
+_signatures = None
+
+def init_worker(budget, test_manifest, output_dir, signature_registry=None):
+    global _budget
+    global _manifest
+    global _signatures
+
+    _budget = budget
+    _manifest = test_manifest
+    _signatures = signature_registry
+    os.chdir(output_dir)
+
+def generate_test_case(test_case, args, budget):
+    (test_case_name, _) = os.path.splitext(os.path.basename(test_case))
+    input_hash = manifest.get_hash(params={"modes" : args.modes})
+
+    if args.resume and _manifest.find(test_case_name, "generate", input_hash) is not None:
+        return
+
+    # CLSmith always writes to CLProg.c in the current directory, hence every
+    # generator runs in its own scratch directory
+    scratch_dir = tempfile.mkdtemp(prefix="clsmith.", dir=os.path.dirname(test_case))
+    start = time.monotonic()
+
+    try:
+        cmd = [args.cl_smith_tool]
+
+        if args.modes:
+            cmd.extend(["--" + mode for mode in args.modes])
+
+        with budget.acquire():
+            subprocess.run(cmd, cwd=scratch_dir, timeout=60, check=True)
+
+        shutil.move(os.path.join(scratch_dir, "CLProg.c"), test_case)
+        _manifest.record(test_case_name, "generate", "ok", input_hash, output=test_case, start=start)
+    except (subprocess.SubprocessError, OSError):
+        _manifest.record(test_case_name, "generate", "failed", input_hash, start=start, reason="aborted generation")
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+def generate_test_cases(test_cases, args, budget, workers, slots):
+    # Runs the generators in the background and yields the test cases as
+    # soon as they are generated. Every generator takes one of the slots,
+    # which the consumer releases once it has processed a test case, so the
+    # generators stop if the later stages cannot keep up. (The pool consumes
+    # the yielded test cases eagerly.)
+    generated = queue.Queue()
+
+    def generate(test_case):
+        slots.acquire()
+
+        try:
+            generate_test_case(test_case, args, budget)
+        finally:
+            # Test cases which could not be generated are reported by the
+            # later stages
+            generated.put(test_case)
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        futures = [executor.submit(generate, test_case) for test_case in test_cases]
+
+        for _ in range(len(futures)):
+            yield generated.get()
+
+        for future in futures:
+            future.result()
+
+def _process_test_case(test_case, args, log_file):
+    test_case_path = test_case
+    (test_case_name, _) = os.path.splitext(os.path.basename(test_case))
+
+    print(os.path.basename(test_case_path), end=" ", flush=True, file=log_file)
+
+    # Test cases are generated ahead by generate_test_cases()
+    if args.generate:
+        if not os.path.isfile(test_case_path):
+            print("-> aborted generation", file=log_file)
+            return
+
+        if args.verbose:
+            print("-> generated", end=" ", flush=True, file=log_file)
+
+    # Check if file exists
+    if not os.path.isfile(test_case_path):
+        print("-> not found", file=log_file)
+        return
+
+    # Preprocess test case if desired
+    if args.preprocess:
+        input_hash = manifest.get_hash(test_case_path)
+        record = resume_stage(args, test_case_name, "preprocess", input_hash, log_file)
+
+        if record is not None:
+            if record["status"] != "ok":
+                return
+
+            test_case_path = record["output"]
+        else:
+            try:
+                start = time.monotonic()
+                cmd = [args.clang]
+                cmd.extend(["-I", args.cl_smith_path, "-E", "-CC", "-o", "{}.pre.cl".format(test_case_name), test_case_path])
+
+                with _budget.acquire():
+                    subprocess.run(cmd, timeout=60, check=True)
+
+                remove_preprocessor_comments("{}.pre.cl".format(test_case_name))
+                test_case_path = os.path.abspath("{}.pre.cl".format(test_case_name))
+                _manifest.record(test_case_name, "preprocess", "ok", input_hash, output=test_case_path, start=start)
+
+                if args.verbose:
+                    print("-> preprocessed", end=" ", flush=True, file=log_file)
+            except subprocess.SubprocessError:
+                _manifest.record(test_case_name, "preprocess", "failed", input_hash, start=start, reason="aborted preprocessing")
+                print("-> aborted preprocessing", file=log_file)
+                return
+
+    # Remove declarations which are not reachable from the kernel
+    if args.prune:
+        input_hash = manifest.get_hash(test_case_path, get_test_fingerprint(args))
+        record = resume_stage(args, test_case_name, "prune", input_hash, log_file)
+
+        if record is not None:
+            test_case_path = record["output"]
+        else:
+            start = time.monotonic()
+            test_class = get_test_class(args.test)
+            test = test_class([test_case_path], get_test_options(test_class, test_case_name))
+            pruner = dead_code_pruning.DeadDeclarationPruner(test_case_path, test)
+            pruned_path = os.path.abspath("{}.prn.cl".format(test_case_name))
+
+            # The pruned test case is only kept if it is still interesting
+            with _budget.acquire(get_test_jobs()):
+                success = pruner.run(pruned_path)
+
+            if success:
+                test_case_path = pruned_path
+                reason = None
+            else:
+                if pruner.pruned is None:
+                    reason = "no AST"
+                elif pruner.pruned == 0:
+                    reason = "nothing pruned"
+                else:
+                    reason = "pruned test case not interesting"
+
+                try:
+                    os.remove(pruned_path)
+                except OSError:
+                    pass
+
+            _manifest.record(test_case_name, "prune", "ok", input_hash, output=test_case_path, start=start, reason=reason)
+
+            if args.verbose:
+                if success:
+                    print("-> pruned {} declarations".format(pruner.pruned), end=" ", flush=True, file=log_file)
+                else:
+                    print("-> {}".format(reason), end=" ", flush=True, file=log_file)
+
+    # Reduce work sizes of the test case
+    if args.reduce_work_sizes:
+        if args.reduce_work_sizes == 1:
+            params = {"mode" : "checked", "test" : get_test_fingerprint(args)}
+        else:
+            params = {"mode" : "unchecked"}
+
+        input_hash = manifest.get_hash(test_case_path, params)
+        record = resume_stage(args, test_case_name, "reduce_work_sizes", input_hash, log_file)
+
+        if record is not None:
+            test_case_path = record["output"]
+        else:
+            start = time.monotonic()
+            shutil.copy(test_case_path, "{}.rws.cl".format(test_case_name))
+            test_case_path = os.path.abspath("{}.rws.cl".format(test_case_name))
+
+            if args.reduce_work_sizes == 1:
+                test_class = get_test_class(args.test)
+                options = get_test_options(test_class, test_case_name)
+                test = test_class([test_case_path], options)
+            else:
+                test = None
+
+            # Up to -n candidate work sizes are tested in parallel
+            reducer = work_size_reduction.WorkSizeReducer(test_case_path, test, jobs=(args.n or 1))
+
+            with _budget.acquire((args.n or 1) * get_test_jobs()):
+                success = reducer.run(checked=(args.reduce_work_sizes == 1))
+
+            del reducer
+            _manifest.record(test_case_name, "reduce_work_sizes", "ok", input_hash, output=test_case_path, start=start, reason=None if success else "work sizes unchanged")
+
+            if args.verbose:
+                if success:
+                    print("-> work sizes reduced", end=" ", flush=True, file=log_file)
+                else:
+                    print("-> work sizes unchanged", end=" ", flush=True, file=log_file)
+
+    # Check if test case is interesting
+    if args.check:
+        input_hash = manifest.get_hash(test_case_path, get_test_fingerprint(args))
+        record = resume_stage(args, test_case_name, "check", input_hash, log_file)
+
+    if args.check and record is not None:
+        if record["status"] != "ok":
+            return
+
+        test_case_path = record["output"]
+    elif args.check:
+        start = time.monotonic()
+        reason = None
+        signature = None
+        test_class = get_test_class(args.test)
+        options = get_test_options(test_class, test_case_name)
+
+        tmp_dir = tempfile.mkdtemp()
+        out_dir = os.getcwd()
+        os.chdir(tmp_dir)
+        test_case_file = os.path.basename(test_case_path)
+        shutil.copy(test_case_path, test_case_file)
+        test = test_class([test_case_file], options)
+        test.collect_signature = _signatures is not None
+
+        try:
+            stop = False
+
+            with _budget.acquire(get_test_jobs()):
+                result = test.run_check()
+
+                if result and _signatures is not None:
+                    signature = test.get_signature()
+
+            if not result:
+                reason = "same output"
+                stop = True
+        except interestingness_tests.TestTimeoutError as err:
+            reason = "timeout ({})".format(err)
+            stop = True
+        except interestingness_tests.InvalidTestCaseError as err:
+            reason = "failure ({})".format(err)
+            stop = True
+        finally:
+            os.chdir(out_dir)
+
+            try:
+                shutil.rmtree(tmp_dir)
+            except OSError:
+                pass
+
+        if stop:
+            _manifest.record(test_case_name, "check", "rejected", input_hash, start=start, reason=reason)
+            print("-> {}".format(reason), file=log_file)
+            return
+        else:
+            shutil.copy(test_case_path, "{}.chk.cl".format(test_case_name))
+            test_case_path = os.path.abspath("{}.chk.cl".format(test_case_name))
+            _manifest.record(test_case_name, "check", "ok", input_hash, output=test_case_path, start=start)
+            print("-> different output", end=" ", flush=True, file=log_file)
+
+            if signature is not None:
+                _signatures.classify(test_case_name, signature)
+
+    # Only a few test cases of every bug are reduced
+    if args.reduce and _signatures is not None:
+        record = _signatures.find(test_case_name)
+
+        if record is not None and record["duplicate"]:
+            _manifest.record(test_case_name, "dedup", "duplicate", None, reason="bug {}".format(record["cluster"]))
+            print("-> duplicate of bug {}".format(record["cluster"]), file=log_file)
+            return
+
+    if args.reduce:
+        input_hash = manifest.get_hash(test_case_path, dict(get_test_fingerprint(args), pre_reduce=args.pre_reduce))
+        record = resume_stage(args, test_case_name, "reduce", input_hash, log_file)
+
+    if args.reduce and record is not None:
+        if record["status"] != "ok":
+            return
+    elif args.reduce:
+        shutil.copy(test_case_path, "{}.red.cl".format(test_case_name))
+        test_case_path = os.path.abspath("{}.red.cl".format(test_case_name))
+
+        # Copied so that the settings do not leak into later test cases
+        reduction_env = os.environ.copy()
+        reduction_env["CREDUCE_TEST_CASE"] = os.path.basename(test_case_path)
+        # Learned order of the validity checks is kept next to the test case
+        reduction_env["CREDUCE_TEST_STATS"] = os.path.abspath("{}.stats.sqlite".format(test_case_name))
+        reduction_env["CREDUCE_TEST_TELEMETRY"] = get_telemetry_file(test_case_name)
+
+        if args.adaptive_timeouts:
+            # Timeouts of the variants are derived from the runtimes of the
+            # tools for the test case which is reduced
+            timeouts_path = os.path.abspath("{}.timeouts.json".format(test_case_name))
+            calibrate_timeouts(args, test_case_path, test_case_name, timeouts_path)
+            reduction_env["CREDUCE_TEST_TIMEOUTS"] = timeouts_path
+
+        size_before = os.path.getsize(test_case_path)
+
+        if args.pre_reduce:
+            # Large irrelevant parts are removed in-process before C-Reduce
+            # starts its own (slower) passes
+            test_class = get_test_class(args.test)
+            test = test_class([test_case_path], test_class.get_test_options(reduction_env))
+            reducer = delta_reduction.DeltaReducer(test_case_path, test, jobs=(args.n or 1))
+
+            with _budget.acquire((args.n or 1) * get_test_jobs()):
+                reducer.run()
+
+            if args.verbose:
+                print("-> pre-reduced ({} checks, {} -> {} bytes)".format(len(reducer.verdicts), size_before, os.path.getsize(test_case_path)), end=" ", flush=True, file=log_file)
+
+            del reducer
+
+        test_script_file = get_test_script_file(args.test)
+        use_test_server = args.test_server and server.TestServerThread.is_supported()
+
+        # Create test case wrapper (one per test case since the test cases
+        # are reduced concurrently by the worker processes)
+        #FIXME: Call python script directly?
+        if sys.platform == "win32":
+            test_wrapper = "{}.test_wrapper.bat".format(test_case_name)
+
+            with open(test_wrapper, "w") as test_file:
+                test_file.write("python {}\n".format(test_script_file))
+
+            os.chmod(test_wrapper, 0o744)
+        else:
+            test_wrapper = "{}.test_wrapper.sh".format(test_case_name)
+
+            with open(test_wrapper, "w") as test_file:
+                test_file.write("#!/bin/bash\n")
+
+                if use_test_server:
+                    # The client only forwards the variant to the test server
+                    test_file.write("exec python3 -S {}\n".format(get_test_client_file()))
+                else:
+                    test_file.write("exec python3 {}\n".format(test_script_file))
+
+            os.chmod(test_wrapper, 0o744)
+
+        cmd = ["perl"]
+        cmd.extend(["--", which("creduce", must_exist=True)])
+
+        if args.n:
+            cmd.extend(["--n", str(args.n)])
+
+        if args.verbose:
+            cmd.append("--debug")
+
+        cmd.append("--timing")
+        cmd.append(test_wrapper)
+        cmd.append(test_case_path)
+
+        with open("{}.log".format(test_case_name), mode="w") as log:
+            try:
+                stop = False
+                reason = None
+                start = time.monotonic()
+
+                # C-Reduce runs up to --n interestingness tests in parallel
+                with _budget.acquire((args.n or 1) * get_test_jobs()):
+                    if use_test_server:
+                        test_class = get_test_class(args.test)
+                        options = test_class.get_test_options(reduction_env)
+
+                        with server.TestServerThread(test_class, options, args.n or 1) as test_server:
+                            reduction_env["CREDUCE_TEST_SERVER"] = test_server.address
+                            proc = subprocess.run(cmd, env=reduction_env, stdout=log, stderr=subprocess.STDOUT, universal_newlines=True)
+                    else:
+                        proc = subprocess.run(cmd, env=reduction_env, stdout=log, stderr=subprocess.STDOUT, universal_newlines=True)
+
+                if proc.returncode:
+                    reason = "reduction failed"
+                    stop = True
+            except subprocess.SubprocessError:
+                reason = "reduction aborted"
+                stop = True
+            finally:
+                log.write("\nRuntime: {} seconds\n".format(round(time.monotonic() - start, 0)))
+
+                if size_before == os.path.getsize(test_case_path):
+                    try:
+                        os.remove(test_case_path)
+                    except OSError:
+                        pass
+
+        if stop:
+            _manifest.record(test_case_name, "reduce", "failed", input_hash, start=start, reason=reason)
+            print("-> {}".format(reason), file=log_file)
+            return
+        else:
+            if os.path.isfile(test_case_path):
+                _manifest.record(test_case_name, "reduce", "ok", input_hash, output=test_case_path, start=start)
+            else:
+                _manifest.record(test_case_name, "reduce", "ok", input_hash, start=start, reason="reduction unchanged")
+
+            if args.verbose:
+                print("-> reduced", file=log_file)
+
+    print("-> done", file=log_file)
+
+def process_test_case(test_case, args):
+    # The log of a test case is collected and written in one piece so that
+    # the output of parallel test cases does not interleave
+    log_file = io.StringIO()
+    _process_test_case(test_case, args, log_file)
+
+    return log_file.getvalue()
+
+def get_final_output(test_case_name):
+    # Output of the last successful stage of the test case (or None)
+    records = [record for record in _manifest.records.values() if record["test_case"] == test_case_name and record["status"] == "ok" and record["output"] is not None]
+
+    if not records:
+        return None
+
+    return max(records, key=lambda record: record["time"])["output"]
+
+def process_queued_test_case(test_case, args):
+    # Returns the test case, status, log and final output for the work queue
+    (test_case_name, _) = os.path.splitext(os.path.basename(test_case))
+
+    try:
+        log = process_test_case(test_case, args)
+    except Exception as err:
+        return (test_case, "failed", "{} -> failed: {}\n".format(os.path.basename(test_case), err), None, None)
+
+    output = get_final_output(test_case_name)
+
+    if output is None or not os.path.isfile(output):
+        return (test_case, "done", log, None, None)
+
+    with open(output, "r", errors="replace") as output_file:
+        return (test_case, "done", log, os.path.basename(output), output_file.read())
+
+def get_result_path(output_dir, output_name):
+    # Output names are reported by the workers (possibly over the network),
+    # hence only plain file names inside the output directory are accepted
+    if not work_queue.is_plain_name(output_name):
+        return None
+
+    path = os.path.join(output_dir, output_name)
+
+    if os.path.dirname(os.path.realpath(path)) != os.path.realpath(output_dir):
+        return None
+
+    return path
+
+def run_coordinator(test_cases, args, output_dir, log_file, poll_interval=5):
+    # Adds the test cases to the work queue and collects the logs and final
+    # outputs of the workers until all test cases are completed
+    test_queue = work_queue.WorkQueue(args.queue)
+
+    for test_case in test_cases:
+        try:
+            with open(test_case, "r", errors="replace") as test_case_file:
+                content = test_case_file.read()
+        except OSError:
+            print("{} -> not found".format(os.path.basename(test_case)), file=log_file)
+            continue
+
+        test_queue.add(os.path.basename(test_case), content)
+
+    # Number of the last collected result
+    collected = 0
+
+    with contextlib.ExitStack() as stack:
+        if args.serve:
+            stack.enter_context(work_queue.WorkQueueServerThread(work_queue.parse_address(args.serve), test_queue))
+
+        while True:
+            finished = test_queue.is_finished()
+
+            for result in test_queue.get_results(collected):
+                collected = result["finished"]
+
+                if result["output"] is not None:
+                    path = get_result_path(output_dir, result["output_name"])
+
+                    if path is None:
+                        print("{} -> invalid output name {!r}".format(result["name"], result["output_name"]), file=log_file)
+                    else:
+                        with open(path, "w") as output_file:
+                            output_file.write(result["output"])
+
+                if args.verbose:
+                    print("[{}]".format(result["worker"]), end=" ", file=log_file)
+
+                print(result["log"], end="", flush=True, file=log_file)
+
+            if finished:
+                break
+
+            time.sleep(poll_interval)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Script to manage the reduction process of OpenCL test cases from generation to the reduced output.")
     inputGroup = parser.add_mutually_exclusive_group(required=True)
@@ -70,14 +668,22 @@ if __name__ == "__main__":
     inputGroup.add_argument("--test-case-dir", help="OpenCL test case directory")
     inputGroup.add_argument("--test-case-list", help="OpenCL test case file")
     inputGroup.add_argument("--test-cases", metavar="TEST CASE", nargs="+", help="OpenCL test case files")
+    inputGroup.add_argument("--report", metavar="TELEMETRY", nargs="+", help="Summarise the telemetry files (or directories containing them) of previous runs and exit")
+    inputGroup.add_argument("--worker", action="store_true", help="Process the test cases leased from the work queue of --queue")
+
+    parser.add_argument("--queue", metavar="LOCATION", help="Work queue shared by a coordinator and its workers: SQLite file or HOST:PORT of a coordinator started with --serve. Without --worker the test cases are added to the queue and the results of the workers are collected.")
+    parser.add_argument("--serve", metavar="HOST:PORT", help="Serve the work queue of the coordinator to workers on other machines")
 
+    parser.add_argument("--schedule", choices=["cost", "name"], default="cost", help="Order in which the test cases are processed: expected runtime (cheapest first) or file name")
     parser.add_argument("--exclude-file", dest="exclude_file", help="File containing a list of test cases that should be ignored")
     parser.add_argument("-n", metavar="NUM", type=int, help="Number of parallel interestingness tests per test case")
+    parser.add_argument("--jobs", "-j", metavar="NUM", type=int, default=os.cpu_count() or 1, help="Maximum number of jobs run in parallel across all test cases (including the parallel interestingness tests of -n; default: number of CPUs)")
 
     processGroup = parser.add_mutually_exclusive_group()
     processGroup.add_argument("--preprocess", action="store_true", help="Preprocess test cases")
     processGroup.add_argument("--preprocessed", action="store_true", help="Treat test cases as already preprocessed")
 
+    parser.add_argument("--prune", action="store_true", help="Remove the declarations which are not reachable from the kernel (requires preprocessed test cases)")
     parser.add_argument("--check", action="store_true", help="Check whether the test cases are interesting")
 
     reduceGroup = parser.add_mutually_exclusive_group()
@@ -85,14 +691,52 @@ if __name__ == "__main__":
     reduceGroup.add_argument("--reduce-work-sizes-unchecked", dest="reduce_work_sizes", action="store_const", const=2, help="Reduce dimensions of the test cases (unchecked)")
 
     parser.add_argument("--reduce", action="store_true", help="Start reduction of the test cases")
+    parser.add_argument("--representatives", metavar="NUM", type=int, help="Only reduce NUM test cases per bug signature determined by --check; the others are recorded as duplicates")
     parser.add_argument("--test", action="store", choices=["wrong-code-bug"], default=None, help="Interestingness test that should be used")
+    parser.add_argument("--no-pre-reduce", dest="pre_reduce", action="store_false", help="Hand the test cases to C-Reduce without removing declarations and lines by delta debugging first")
+    parser.add_argument("--no-adaptive-timeouts", dest="adaptive_timeouts", action="store_false", help="Use the fixed CREDUCE_TEST_TIMEOUT for all variants instead of timeouts derived from the runtimes of the original test case")
+    parser.add_argument("--no-test-server", dest="test_server", action="store_false", help="Start a new interestingness test process for every variant instead of using a test server")
     parser.add_argument("--modes", nargs="+", action="store", choices=["atomic_reductions", "atomics", "barriers", "divergence", "fake_divergence", "group_divergence", "inter_thread_comm", "vectors"], help="CLsmith modes")
     parser.add_argument("--output", help="Output directory")
     parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
     parser.add_argument("--log", help="Log completed test cases")
+    parser.add_argument("--manifest", help="JSON lines file recording the outcome of every stage (default: manifest.jsonl in the output directory)")
+    parser.add_argument("--resume", action="store_true", help="Skip stages which have already been completed for the same input according to the manifest")
 
     args = parser.parse_args()
 
+    if args.report:
+        report = telemetry.Report()
+
+        for path in telemetry.find_telemetry_files(args.report):
+            report.add_file(path)
+
+        print(report.format())
+        sys.exit(0)
+
+    if args.worker and args.queue is None:
+        print("--worker requires --queue")
+        sys.exit(1)
+
+    if args.queue is not None and args.generate:
+        print("--generate can not be combined with --queue")
+        sys.exit(1)
+
+    # The coordinator only distributes the test cases, the stages are run by
+    # the workers
+    coordinator = args.queue is not None and not args.worker
+
+    if coordinator and work_queue.is_remote(args.queue):
+        print("The coordinator requires a queue file")
+        sys.exit(1)
+
+    if args.serve and (not coordinator or work_queue.parse_address(args.serve) is None):
+        print("--serve requires a queue file and HOST:PORT")
+        sys.exit(1)
+
+    if args.queue is not None and not work_queue.is_remote(args.queue):
+        args.queue = os.path.abspath(args.queue)
+
     # Log completed test cases
     if args.log:
         log_file = open(os.path.abspath(args.log), mode="w", buffering=1)
@@ -102,23 +746,30 @@ if __name__ == "__main__":
     # Print invocation for logging purposes
     print("Command: {}".format(" ".join(sys.argv)), file=log_file)
 
-    if args.generate or args.preprocess or not args.preprocessed:
+    if not coordinator and (args.generate or args.preprocess or not args.preprocessed):
         cl_smith_path = os.environ.get("CLSMITH_INCLUDE_PATH")
 
         if cl_smith_path is None:
             print("CLSMITH_INCLUDE_PATH not defined!")
             sys.exit(1)
 
-    if args.check or args.reduce_work_sizes == 1 or args.reduce:
-        if os.environ.get("CREDUCE_TEST_PLATFORM") is None:
-            print("CREDUCE_TEST_PLATFORM not defined!")
-            sys.exit(1)
+        args.cl_smith_path = cl_smith_path
 
-        if os.environ.get("CREDUCE_TEST_DEVICE") is None:
-            print("CREDUCE_TEST_DEVICE not defined!")
-            sys.exit(1)
+    if not coordinator and (args.check or args.prune or args.reduce_work_sizes == 1 or args.reduce):
+        # Fail early instead of inside the workers
+        get_test_class(args.test)
+
+        # A device set replaces the single platform and device
+        if os.environ.get("CREDUCE_TEST_DEVICES") is None:
+            if os.environ.get("CREDUCE_TEST_PLATFORM") is None:
+                print("CREDUCE_TEST_PLATFORM not defined!")
+                sys.exit(1)
 
-    if args.check or args.reduce_work_sizes == 1 or args.reduce:
+            if os.environ.get("CREDUCE_TEST_DEVICE") is None:
+                print("CREDUCE_TEST_DEVICE not defined!")
+                sys.exit(1)
+
+    if not coordinator and (args.check or args.prune or args.reduce_work_sizes == 1 or args.reduce):
         cl_launcher = os.environ.get("CREDUCE_TEST_CL_LAUNCHER", os.path.abspath("./cl_launcher"))
 
         if which(cl_launcher) is None:
@@ -130,13 +781,15 @@ if __name__ == "__main__":
 
     clang = os.environ.get("CREDUCE_TEST_CLANG", os.path.abspath("./clang"))
 
-    if which(clang) is None:
+    if which(clang) is None and not coordinator:
         clang = os.path.basename(clang)
 
         if which(clang) is None:
             print("CREDUCE_TEST_CLANG not defined and clang not found!")
             sys.exit(1)
 
+    args.clang = clang
+
     # Save current directory
     orig_dir = os.path.abspath(os.getcwd())
 
@@ -168,6 +821,8 @@ if __name__ == "__main__":
                 print("CLSmith not found!")
                 sys.exit(1)
 
+        args.cl_smith_tool = cl_smith_tool
+
     elif args.test_cases:
         test_cases = [os.path.abspath(test_case) for test_case in args.test_cases if os.path.basename(test_case) not in excluded_files]
     elif args.test_case_dir:
@@ -176,6 +831,9 @@ if __name__ == "__main__":
     elif args.test_case_list:
         with open(args.test_case_list, mode="r") as test_case_list:
             test_cases = [os.path.abspath(test_case.strip()) for test_case in test_case_list.readlines() if test_case.strip() not in excluded_files]
+    elif args.worker:
+        # Test cases are leased from the work queue
+        test_cases = []
 
     # Sort test cases
     alpha_num_key = lambda s : [int(c) if c.isdigit() else c for c in re.split("([0-9]+)", s)]
@@ -184,6 +842,20 @@ if __name__ == "__main__":
     # Change to output directory
     os.chdir(output_dir)
 
+    # Cheap test cases first so that their results are available early. The
+    # runtimes measured by earlier runs are taken from the telemetry files.
+    if args.schedule == "cost" and not args.generate:
+        test_cases = scheduling.sort_by_cost(test_cases, lambda test_case: get_telemetry_file(os.path.splitext(os.path.basename(test_case))[0]))
+
+    if coordinator:
+        run_coordinator(test_cases, args, output_dir, log_file)
+        os.chdir(orig_dir)
+
+        if args.log:
+            log_file.close()
+
+        sys.exit(0)
+
     # Copy header files if unpreprocessed test cases should be reduced etc.
     if not args.preprocess and not args.preprocessed:
         shutil.copy(os.path.join(cl_smith_path, "CLSmith.h"), ".")
@@ -191,181 +863,66 @@ if __name__ == "__main__":
         shutil.copy(os.path.join(cl_smith_path, "cl_safe_math_macros.h"), ".")
 
     # Iterate over all test cases
-    for test_case in test_cases:
-        test_case_path = test_case
-        (test_case_name, _) = os.path.splitext(os.path.basename(test_case))
+    budget = JobBudget(max(1, args.jobs))
+    test_manifest = manifest.Manifest(args.manifest or os.path.join(output_dir, "manifest.jsonl"))
 
-        print(os.path.basename(test_case_path), end=" ", flush=True, file=log_file)
+    if args.resume:
+        test_manifest.load()
 
-        # Generate test case if desired
-        if args.generate:
-            try:
-                cmd = [cl_smith_tool]
+    # Also used by the generators of the main process
+    _manifest = test_manifest
 
-                if args.modes:
-                    cmd.extend(["--" + mode for mode in args.modes])
-
-                subprocess.run(cmd, timeout=60, check=True)
-            except subprocess.SubprocessError:
-                print("-> aborted generation", file=log_file)
-                continue
-
-            test_case_path = os.path.abspath("./{}.cl".format(test_case_name))
-            shutil.move("CLProg.c", test_case_path)
-
-            if args.verbose:
-                print("-> generated", end=" ", flush=True, file=log_file)
-
-        # Check if file exists
-        if not os.path.isfile(test_case_path):
-            print("-> not found", file=log_file)
-            continue
+    if args.representatives is not None:
+        signature_registry = signatures.SignatureRegistry(os.path.join(output_dir, "signatures.jsonl"), max(1, args.representatives))
+    else:
+        signature_registry = None
+
+    # Every worker leases at most as many test cases as it processes in
+    # parallel so that the other workers get the remaining ones
+    if args.worker:
+        queue_worker = work_queue.QueueWorker(work_queue.open_work_queue(args.queue), "{}:{}".format(platform.node(), os.getpid()), max(1, args.jobs))
+        pending_test_cases = queue_worker.get_test_cases(output_dir)
+        workers = max(1, args.jobs)
+    elif args.generate:
+        generation_slots = threading.Semaphore(2 * max(1, args.jobs))
+        pending_test_cases = generate_test_cases(test_cases, args, budget, max(1, args.jobs), generation_slots)
+        workers = min(args.jobs, len(test_cases))
+    else:
+        pending_test_cases = iter(test_cases)
+        workers = min(args.jobs, len(test_cases))
 
-        # Preprocess test case if desired
-        if args.preprocess:
-            try:
-                cmd = [clang]
-                cmd.extend(["-I", cl_smith_path, "-E", "-CC", "-o", "{}.pre.cl".format(test_case_name), test_case_path])
-                subprocess.run(cmd, timeout=60, check=True)
-                remove_preprocessor_comments("{}.pre.cl".format(test_case_name))
-                test_case_path = os.path.abspath("{}.pre.cl".format(test_case_name))
+    process = functools.partial(process_queued_test_case if args.worker else process_test_case, args=args)
 
-                if args.verbose:
-                    print("-> preprocessed", end=" ", flush=True, file=log_file)
-            except subprocess.SubprocessError:
-                print("-> aborted preprocessing", file=log_file)
-                continue
-
-        # Reduce work sizes of the test case
-        if args.reduce_work_sizes:
-            shutil.copy(test_case_path, "{}.rws.cl".format(test_case_name))
-            test_case_path = os.path.abspath("{}.rws.cl".format(test_case_name))
+    def complete(result):
+        if args.generate:
+            generation_slots.release()
 
-            if args.reduce_work_sizes == 1:
-                test_class = get_test_class(args.test)
-                options = test_class.get_test_options(os.environ)
-                test = test_class([test_case_path], options)
-            else:
-                test = None
+        if not args.worker:
+            return result
 
-            reducer = work_size_reduction.WorkSizeReducer(test_case_path, test)
-            success = reducer.run(checked=(args.reduce_work_sizes == 1))
+        (test_case, status, log, output_name, output) = result
+        queue_worker.complete(test_case, status, log, output_name, output)
 
-            if args.verbose:
-                if success:
-                    print("-> work sizes reduced", end=" ", flush=True, file=log_file)
-                else:
-                    print("-> work sizes unchanged", end=" ", flush=True, file=log_file)
+        return log
 
-        # Check if test case is interesting
-        if args.check:
-            test_class = get_test_class(args.test)
-            options = test_class.get_test_options(os.environ)
+    with contextlib.ExitStack() as stack:
+        if args.worker:
+            stack.enter_context(queue_worker)
 
-            tmp_dir = tempfile.mkdtemp()
-            out_dir = os.getcwd()
-            os.chdir(tmp_dir)
-            test_case_file = os.path.basename(test_case_path)
-            shutil.copy(test_case_path, test_case_file)
-            test = test_class([test_case_file], options)
+        if workers > 1:
+            pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(budget, test_manifest, output_dir, signature_registry))
 
             try:
-                stop = False
-                result = test.check()
-
-                if not result:
-                    print("-> same output", file=log_file)
-                    stop = True
-            except interestingness_tests.TestTimeoutError as err:
-                print("-> timeout ({})".format(err), file=log_file)
-                stop = True
-            except interestingness_tests.InvalidTestCaseError as err:
-                print("-> failure ({})".format(err), file=log_file)
-                stop = True
+                for result in pool.imap_unordered(process, pending_test_cases):
+                    print(complete(result), end="", flush=True, file=log_file)
             finally:
-                os.chdir(out_dir)
-
-                try:
-                    shutil.rmtree(tmp_dir)
-                except OSError:
-                    pass
-
-            if stop:
-                continue
-            else:
-                shutil.copy(test_case_path, "{}.chk.cl".format(test_case_name))
-                test_case_path = os.path.abspath("{}.chk.cl".format(test_case_name))
-                print("-> different output", end=" ", flush=True, file=log_file)
-
-        if args.reduce:
-            shutil.copy(test_case_path, "{}.red.cl".format(test_case_name))
-            test_case_path = os.path.abspath("{}.red.cl".format(test_case_name))
-
-            reduction_env = os.environ
-            reduction_env["CREDUCE_TEST_CASE"] = os.path.basename(test_case_path)
-
-            test_script_file = get_test_script_file(args.test)
-
-            # Create test case wrapper
-            #FIXME: Call python script directly?
-            if sys.platform == "win32":
-                test_wrapper = "test_wrapper.bat"
-
-                with open(test_wrapper, "w") as test_file:
-                    test_file.write("python {}\n".format(test_script_file))
-
-                os.chmod(test_wrapper, 0o744)
-            else:
-                test_wrapper = "test_wrapper.sh"
-
-                with open(test_wrapper, "w") as test_file:
-                    test_file.write("#!/bin/bash\n")
-                    test_file.write("exec python3 {}\n".format(test_script_file))
-
-                os.chmod(test_wrapper, 0o744)
-
-            cmd = ["perl"]
-            cmd.extend(["--", which("creduce", must_exist=True)])
-
-            if args.n:
-                cmd.extend(["--n", str(args.n)])
-
-            if args.verbose:
-                cmd.append("--debug")
-
-            cmd.append("--timing")
-            cmd.append(test_wrapper)
-            cmd.append(test_case_path)
-
-            with open("{}.log".format(test_case_name), mode="w") as log:
-                try:
-                    stop = False
-                    size_before = os.path.getsize(test_case_path)
-                    start = time.monotonic()
-                    proc = subprocess.run(cmd, env=reduction_env, stdout=log, stderr=subprocess.STDOUT, universal_newlines=True)
-
-                    if proc.returncode:
-                        print("-> reduction failed", file=log_file)
-                        stop = True
-                except subprocess.SubprocessError:
-                    print("-> reduction aborted", file=log_file)
-                    stop = True
-                finally:
-                    log.write("\nRuntime: {} seconds\n".format(round(time.monotonic() - start, 0)))
-
-                    if size_before == os.path.getsize(test_case_path):
-                        try:
-                            os.remove(test_case_path)
-                        except OSError:
-                            pass
-
-            if stop:
-                continue
-            else:
-                if args.verbose:
-                    print("-> reduced", file=log_file)
+                pool.close()
+                pool.join()
+        else:
+            init_worker(budget, test_manifest, output_dir, signature_registry)
 
-        print("-> done", file=log_file)
+            for test_case in pending_test_cases:
+                print(complete(process(test_case)), end="", flush=True, file=log_file)
 
     os.chdir(orig_dir)
 
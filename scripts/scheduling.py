@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import interestingness_tests
+import os
+from interestingness_tests import telemetry
+
+def get_work_items(test_case):
+    work_sizes = interestingness_tests.TestCase.get(test_case).get_work_sizes()
+
+    if work_sizes is None:
+        return 1
+
+    items = 1
+
+    for size in work_sizes[1]:
+        items *= size
+
+    return items
+
+def get_proxy_cost(test_case):
+    # Missing test cases fail immediately
+    try:
+        return max(1, os.path.getsize(test_case)) * get_work_items(test_case)
+    except OSError:
+        return 0
+
+def get_oracle_runtime(telemetry_path):
+    # Mean runtime of Oclgrind per check recorded by an earlier run or None
+    if not os.path.isfile(telemetry_path):
+        return None
+
+    runtimes = []
+
+    for event in telemetry.read_events(telemetry_path):
+        durations = [tool["duration"] for tool in event.get("tools", []) if tool.get("tool") == "oclgrind" and tool.get("outcome") == "ok"]
+
+        if durations:
+            runtimes.append(sum(durations))
+
+    if not runtimes:
+        return None
+
+    return sum(runtimes) / len(runtimes)
+
+def estimate_costs(test_cases, get_telemetry_path):
+    # Expected runtime of every test case. Test cases without measured
+    # runtime are estimated from the size of the file times the number of
+    # work items, scaled by the median ratio between the measured runtimes
+    # and this estimate (without measurements only the order is meaningful).
+    proxies = {test_case : get_proxy_cost(test_case) for test_case in test_cases}
+    measured = dict()
+
+    for test_case in test_cases:
+        runtime = get_oracle_runtime(get_telemetry_path(test_case))
+
+        if runtime is not None:
+            measured[test_case] = runtime
+
+    ratios = sorted(runtime / proxies[test_case] for (test_case, runtime) in measured.items() if proxies[test_case] > 0)
+    scale = ratios[len(ratios) // 2] if ratios else 1.0
+
+    return {test_case : measured.get(test_case, proxies[test_case] * scale) for test_case in test_cases}
+
+def sort_by_cost(test_cases, get_telemetry_path):
+    # Cheapest first (the sort is stable for test cases with equal costs)
+    costs = estimate_costs(test_cases, get_telemetry_path)
+
+    return sorted(test_cases, key=lambda test_case: costs[test_case])
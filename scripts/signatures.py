@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import multiprocessing
+import os
+
+from interestingness_tests import jsonl
+
+class SignatureRegistry:
+    # Clusters the interesting test cases by their bug signature (see
+    # InterestingnessTest.get_signature). Only the first `representatives`
+    # test cases of a cluster are marked for reduction, the others are
+    # duplicates. The assignments are appended to a JSON lines file which is
+    # shared by the workers and keeps the assignments of resumed runs.
+    def __init__(self, path, representatives):
+        self.path = os.path.abspath(path)
+        self.representatives = representatives
+        self.lock = multiprocessing.Lock()
+
+    @staticmethod
+    def get_cluster(signature):
+        return hashlib.sha256(json.dumps(signature, sort_keys=True).encode()).hexdigest()[:12]
+
+    def load(self):
+        records = []
+
+        if not os.path.exists(self.path):
+            return records
+
+        records.extend(jsonl.read_records(self.path))
+
+        return records
+
+    def find(self, test_case):
+        with self.lock:
+            records = [record for record in self.load() if record["test_case"] == test_case]
+
+        return records[-1] if records else None
+
+    def classify(self, test_case, signature):
+        # Returns the record of the test case (the earlier one if it has
+        # already been classified)
+        cluster = self.get_cluster(signature)
+
+        with self.lock:
+            records = self.load()
+
+            for record in records:
+                if record["test_case"] == test_case and record["cluster"] == cluster:
+                    return record
+
+            index = sum(1 for record in records if record["cluster"] == cluster)
+            record = {"test_case" : test_case,
+                      "cluster" : cluster,
+                      "index" : index,
+                      "duplicate" : index >= self.representatives,
+                      "signature" : signature}
+
+            jsonl.append_record(self.path, record)
+
+        return record
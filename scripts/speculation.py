@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+import interestingness_tests
+import os
+import shutil
+import tempfile
+
+class CandidateTester:
+    # Tests candidate variants of a test case speculatively. Up to `jobs`
+    # candidates are tested concurrently, each in its own copy of the test
+    # case, and the remaining tests are cancelled as soon as the first
+    # interesting candidate is known. Candidates are hashable keys which are
+    # turned into the content of the copy by format_candidate. Verdicts are
+    # memoized since searches often revisit candidates.
+    def __init__(self, test_case, test, format_candidate, jobs=1):
+        self.test_case = interestingness_tests.TestCase.get(test_case)
+        self.test = test
+        self.format_candidate = format_candidate
+        self.jobs = max(1, jobs)
+        self.verdicts = dict()
+
+    def create_test(self, candidate):
+        # The copy is placed next to the test case so that included headers
+        # are still found
+        (directory, name) = os.path.split(os.path.abspath(self.test_case.path))
+        (fd, path) = tempfile.mkstemp(prefix=os.path.splitext(name)[0] + ".", suffix=".cl", dir=directory)
+        os.close(fd)
+
+        # The test does not read the copy again
+        test_case = interestingness_tests.TestCase.write(path, self.format_candidate(candidate))
+        test = self.test.__class__([test_case], self.test.options)
+        test.stage_statistics = self.test.stage_statistics
+        # Files written by the tools (e.g. objects of the static checks) are
+        # removed together with the copy
+        test.working_dir = tempfile.mkdtemp(prefix=os.path.splitext(name)[0] + ".", dir=directory)
+
+        return test
+
+    @staticmethod
+    def remove_test(test):
+        try:
+            os.remove(test.test_cases[0].path)
+        except OSError:
+            pass
+
+        shutil.rmtree(test.working_dir, ignore_errors=True)
+
+    @staticmethod
+    def run_test(test):
+        try:
+            return bool(test.run_check())
+        except (interestingness_tests.TestTimeoutError, interestingness_tests.InvalidTestCaseError):
+            return False
+
+    def find_first(self, candidates):
+        # Returns the index of the first interesting candidate (or None)
+        def decide():
+            for (index, candidate) in enumerate(candidates):
+                if candidate not in self.verdicts:
+                    return (False, None)
+                elif self.verdicts[candidate]:
+                    return (True, index)
+
+            return (True, None)
+
+        (done, index) = decide()
+
+        if done:
+            return index
+
+        # Copies are only created when their test is started
+        queue = []
+        queued = set()
+
+        for candidate in candidates:
+            if candidate not in self.verdicts and candidate not in queued:
+                queue.append(candidate)
+                queued.add(candidate)
+
+        tests = dict()
+        futures = dict()
+
+        # Candidates are submitted in order so that with fewer jobs than
+        # candidates the first ones are tested first
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                while not done:
+                    while queue and len(futures) < self.jobs:
+                        candidate = queue.pop(0)
+                        tests[candidate] = self.create_test(candidate)
+                        futures[executor.submit(self.run_test, tests[candidate])] = candidate
+
+                    (finished, _) = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                    for future in finished:
+                        self.verdicts[futures.pop(future)] = future.result()
+
+                    (done, index) = decide()
+
+                # The verdicts of cancelled tests are not recorded
+                for (future, candidate) in futures.items():
+                    future.cancel()
+                    tests[candidate].cancel()
+        finally:
+            for test in tests.values():
+                self.remove_test(test)
+
+        return index
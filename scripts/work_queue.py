@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import re
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+
+class WorkQueueError(Exception):
+    pass
+
+class WorkQueue:
+    # Persistent queue of test cases shared by a coordinator and its workers
+    # (SQLite in WAL mode). The coordinator adds the test cases together with
+    # their content so that the workers do not need access to its file
+    # system. Workers lease one test case at a time and have to renew the
+    # lease while they process it. Leases of crashed workers expire and the
+    # test case is handed to the next worker, at most max_attempts times.
+    def __init__(self, path, lease_time=300, max_attempts=3, timeout=60):
+        self.path = path
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        # Shared by the threads of the queue server
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        # Completed test cases are numbered in the order they were completed
+        # (finished) so that the coordinator only fetches new results
+        self.connection.execute("CREATE TABLE IF NOT EXISTS jobs (name TEXT PRIMARY KEY, content TEXT NOT NULL, status TEXT NOT NULL, worker TEXT, lease_expires REAL, attempts INTEGER NOT NULL DEFAULT 0, log TEXT, output_name TEXT, output TEXT, finished INTEGER)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished)")
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        if getattr(self, "connection", None) is not None:
+            self.connection.close()
+            self.connection = None
+
+    def __expire(self, now):
+        # Gives up on test cases whose workers crashed too often
+        self.connection.execute("UPDATE jobs SET status = 'failed', log = name || ' -> lease of ' || worker || ' expired after ' || attempts || ' attempts\n', finished = (SELECT IFNULL(MAX(finished), 0) FROM jobs) + rowid WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?", (now, self.max_attempts))
+
+    def add(self, name, content):
+        # Returns False if the test case has already been added
+        with self.lock:
+            cursor = self.connection.execute("INSERT OR IGNORE INTO jobs (name, content, status) VALUES (?, ?, 'pending')", (name, content))
+
+        return cursor.rowcount == 1
+
+    def lease(self, worker):
+        # Returns the next test case as dict with name and content or None
+        with self.lock:
+            now = time.time()
+            self.connection.execute("BEGIN IMMEDIATE")
+
+            try:
+                self.__expire(now)
+                # Test cases are handed out in the order they were added
+                row = self.connection.execute("SELECT name, content FROM jobs WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) ORDER BY rowid LIMIT 1", (now,)).fetchone()
+
+                if row is not None:
+                    self.connection.execute("UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE name = ?", (worker, now + self.lease_time, row[0]))
+
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            return None
+
+        return {"name" : row[0], "content" : row[1]}
+
+    def renew(self, name, worker):
+        # Returns False if the lease has expired and been taken over
+        with self.lock:
+            cursor = self.connection.execute("UPDATE jobs SET lease_expires = ? WHERE name = ? AND worker = ? AND status = 'leased'", (time.time() + self.lease_time, name, worker))
+
+        return cursor.rowcount == 1
+
+    def complete(self, name, worker, status="done", log=None, output_name=None, output=None):
+        # Results of workers which have lost their lease are dropped
+        with self.lock:
+            cursor = self.connection.execute("UPDATE jobs SET status = ?, log = ?, output_name = ?, output = ?, lease_expires = NULL, finished = (SELECT IFNULL(MAX(finished), 0) + 1 FROM jobs) WHERE name = ? AND worker = ? AND status = 'leased'", (status, log, output_name, output, name, worker))
+
+        return cursor.rowcount == 1
+
+    def is_finished(self):
+        with self.lock:
+            self.__expire(time.time())
+            row = self.connection.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'leased')").fetchone()
+
+        return row[0] == 0
+
+    def get_counts(self):
+        with self.lock:
+            rows = self.connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+
+        return dict(rows)
+
+    def get_results(self, after=0):
+        # Test cases completed after the result numbered `after` (see the
+        # finished number of the returned results)
+        with self.lock:
+            rows = self.connection.execute("SELECT finished, name, status, worker, log, output_name, output FROM jobs WHERE finished > ? ORDER BY finished", (after,)).fetchall()
+
+        keys = ("finished", "name", "status", "worker", "log", "output_name", "output")
+
+        return [dict(zip(keys, row)) for row in rows]
+
+class WorkQueueRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode())
+            response = {"result" : self.server.dispatch(request["method"], request.get("params", {}))}
+        except Exception as err:
+            response = {"error" : str(err)}
+
+        self.wfile.write((json.dumps(response) + "\n").encode())
+
+class WorkQueueServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    # Makes a WorkQueue available to workers on other machines. Every request
+    # is a JSON object with method and params on a line of its own, the
+    # response is a JSON object with either result or error.
+    daemon_threads = True
+    allow_reuse_address = True
+    methods = {"lease", "renew", "complete", "is_finished"}
+
+    def __init__(self, address, work_queue):
+        self.work_queue = work_queue
+
+        super().__init__(address, WorkQueueRequestHandler)
+
+    def dispatch(self, method, params):
+        if method not in self.methods:
+            raise WorkQueueError("Unknown method {}".format(method))
+
+        return getattr(self.work_queue, method)(**params)
+
+class WorkQueueServerThread:
+    # Runs a WorkQueueServer for the duration of a with block
+    def __init__(self, address, work_queue):
+        self.server = WorkQueueServer(address, work_queue)
+        self.thread = None
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+class RemoteWorkQueue:
+    # Worker side of a WorkQueueServer
+    def __init__(self, address, timeout=60):
+        self.address = address
+        self.timeout = timeout
+
+    def __call(self, method, **params):
+        with socket.create_connection(self.address, timeout=self.timeout) as connection:
+            connection.sendall((json.dumps({"method" : method, "params" : params}) + "\n").encode())
+
+            with connection.makefile("rb") as response_file:
+                line = response_file.readline()
+
+        if not line:
+            raise WorkQueueError("No response from {}:{}".format(*self.address))
+
+        response = json.loads(line.decode())
+
+        if "error" in response:
+            raise WorkQueueError(response["error"])
+
+        return response["result"]
+
+    def lease(self, worker):
+        return self.__call("lease", worker=worker)
+
+    def renew(self, name, worker):
+        return self.__call("renew", name=name, worker=worker)
+
+    def complete(self, name, worker, status="done", log=None, output_name=None, output=None):
+        return self.__call("complete", name=name, worker=worker, status=status, log=log, output_name=output_name, output=output)
+
+    def is_finished(self):
+        return self.__call("is_finished")
+
+def is_plain_name(name):
+    # Names of test cases and outputs come from other machines, hence they
+    # must not leave the directory they are written to
+    return bool(name) and name not in (".", "..") and not any(separator in name for separator in ("/", "\\", os.sep)) and "\0" not in name
+
+def parse_address(address):
+    # Returns (host, port) for HOST:PORT or None
+    match = re.fullmatch(r"(.*):(\d+)", address)
+
+    if match is None:
+        return None
+
+    return (match.group(1) or "localhost", int(match.group(2)))
+
+def is_remote(location):
+    # Existing files are always queues, otherwise HOST:PORT addresses a queue
+    # server
+    return parse_address(location) is not None and not os.path.exists(location)
+
+def open_work_queue(location):
+    if is_remote(location):
+        return RemoteWorkQueue(parse_address(location))
+
+    return WorkQueue(location)
+
+class QueueWorker:
+    # Leases test cases for up to `slots` parallel workers and renews the
+    # leases in a background thread until the test cases are completed
+    def __init__(self, work_queue, worker, slots=1, poll_interval=5):
+        self.work_queue = work_queue
+        self.worker = worker
+        self.slots = threading.Semaphore(slots)
+        self.poll_interval = poll_interval
+        self.leased = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.__renew_leases)
+        self.thread.daemon = True
+        self.thread.start()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stopped.set()
+        self.thread.join()
+
+    def __renew_leases(self):
+        interval = getattr(self.work_queue, "lease_time", 300) / 3
+
+        while not self.stopped.wait(min(interval, 60)):
+            with self.lock:
+                names = list(self.leased)
+
+            for name in names:
+                try:
+                    self.work_queue.renew(name, self.worker)
+                except (OSError, WorkQueueError, sqlite3.Error):
+                    # The next renewal may still be in time
+                    pass
+
+    def get_test_cases(self, directory):
+        # Writes the leased test cases to the directory and yields their
+        # paths. Stops once no test case is pending or leased by any worker.
+        while True:
+            self.slots.acquire()
+            job = self.work_queue.lease(self.worker)
+
+            if job is None:
+                self.slots.release()
+
+                if self.work_queue.is_finished():
+                    return
+
+                # Leases of other workers may still expire
+                time.sleep(self.poll_interval)
+                continue
+
+            if not is_plain_name(job["name"]):
+                self.work_queue.complete(job["name"], self.worker, "failed", "{!r} -> invalid test case name\n".format(job["name"]))
+                self.slots.release()
+                continue
+
+            path = os.path.join(directory, job["name"])
+
+            with open(path, "w") as test_case_file:
+                test_case_file.write(job["content"])
+
+            with self.lock:
+                self.leased.add(job["name"])
+
+            yield path
+
+    def complete(self, test_case, status="done", log=None, output_name=None, output=None):
+        name = os.path.basename(test_case)
+
+        try:
+            return self.work_queue.complete(name, self.worker, status, log, output_name, output)
+        finally:
+            with self.lock:
+                self.leased.discard(name)
+
+            self.slots.release()
@@ -1,56 +1,115 @@
 #!/usr/bin/env python3
 
-import re
+import interestingness_tests
+import speculation
+
+def get_divisors(n, limit):
+    return [d for d in range(1, min(n, limit) + 1) if n % d == 0]
 
 class WorkSizeReducer:
-    def __init__(self, test_case, test):
-        self.test_case = open(test_case, "r+")
+    # Searches for the smallest work sizes for which the test case is still
+    # interesting. The dimensions are minimised one after another, first the
+    # global and then the local work size, by searching over the valid
+    # (global, local) pairs. Up to `jobs` candidates of the search interval
+    # are tested concurrently (see speculation.CandidateTester; with one job
+    # this is a bisection). Only interesting candidates are kept hence the
+    # result is always interesting even if the interestingness is not
+    # monotonic in the work size.
+    def __init__(self, test_case, test, jobs=1):
+        self.test_case = interestingness_tests.TestCase.get(test_case)
         self.test = test
-        test_case_content = self.test_case.read()
+        self.jobs = max(1, jobs)
+        self.tester = speculation.CandidateTester(self.test_case, test, lambda work_sizes: self.__format_test_case(*work_sizes), self.jobs)
+        self.verdicts = self.tester.verdicts
 
-        work_sizes_match = re.search(r"//(.*) -g ([0-9]+),([0-9]+),([0-9]+) -l ([0-9]+),([0-9]+),([0-9]+)\n", test_case_content)
+        work_sizes = self.test_case.get_work_sizes()
 
-        if work_sizes_match is not None:
-            self.meta_information = work_sizes_match.group(1)
-            self.orig_global_work_size = (work_sizes_match.group(2), work_sizes_match.group(3), work_sizes_match.group(4))
-            self.orig_local_work_size = (work_sizes_match.group(5), work_sizes_match.group(6), work_sizes_match.group(7))
-            self.test_case_content = test_case_content.replace(work_sizes_match.group(0), "")
+        if work_sizes is not None:
+            (self.meta_information, self.orig_global_work_size, self.orig_local_work_size, self.test_case_content) = work_sizes
+        else:
+            self.meta_information = None
 
-    def __del__(self):
-        self.test_case.close()
+    def __format_test_case(self, global_work_size, local_work_size):
+        header = "//{0} -g {1[0]},{1[1]},{1[2]} -l {2[0]},{2[1]},{2[2]}\n".format(self.meta_information, global_work_size, local_work_size)
+        return header + self.test_case_content
 
     def __rewrite_work_sizes(self, global_work_size, local_work_size):
-        self.test_case.seek(0)
-        self.test_case.truncate()
-        self.test_case.write("//{0} -g {1[0]},{1[1]},{1[2]} -l {2[0]},{2[1]},{2[2]}\n".format(self.meta_information, global_work_size, local_work_size))
-        self.test_case.write(self.test_case_content)
-        self.test_case.flush()
+        self.test_case = interestingness_tests.TestCase.write(self.test_case.path, self.__format_test_case(global_work_size, local_work_size))
+
+    def __find_first(self, candidates):
+        return self.tester.find_first(candidates)
+
+    def __search(self, candidates):
+        # The last candidate is known to be interesting. The interval is split
+        # by up to `jobs` evenly spaced candidates which are tested at once.
+        low = 0
+        high = len(candidates) - 1
+
+        while low < high:
+            count = min(self.jobs, high - low)
+            points = sorted({low + (high - low) * (i + 1) // (count + 1) for i in range(0, count)})
+            index = self.__find_first([candidates[point] for point in points])
+
+            if index is None:
+                low = points[-1] + 1
+            else:
+                high = points[index]
+
+                if index > 0:
+                    low = points[index - 1] + 1
+
+        return candidates[high]
 
-    def __update_work_sizes(global_work_size, local_work_size):
-        #FIXME: Come up with a better algorithm
-        local_work_size = [s + 1 for s in local_work_size]
+    @staticmethod
+    def __replace(work_size, dimension, size):
+        return work_size[:dimension] + (size,) + work_size[dimension + 1:]
 
-        for i in range(0, len(global_work_size)):
-            while global_work_size[i] % local_work_size[i] != 0:
-                global_work_size[i] += 1
+    def get_global_candidates(self, work_sizes, dimension):
+        # Every global size up to the current one, each paired with the
+        # largest local size which divides it and does not exceed the
+        # current local size
+        (global_work_size, local_work_size) = work_sizes
+        candidates = []
 
-        return (global_work_size, local_work_size)
+        for size in range(1, global_work_size[dimension] + 1):
+            local_size = get_divisors(size, local_work_size[dimension])[-1]
+            candidates.append((self.__replace(global_work_size, dimension, size),
+                               self.__replace(local_work_size, dimension, local_size)))
+
+        return candidates
+
+    def get_local_candidates(self, work_sizes, dimension):
+        (global_work_size, local_work_size) = work_sizes
+
+        return [(global_work_size, self.__replace(local_work_size, dimension, size))
+                for size in get_divisors(global_work_size[dimension], local_work_size[dimension])]
 
     def run(self, checked):
-        new_global_work_size = [1] * len(self.orig_global_work_size)
-        new_local_work_size = [1] * len(self.orig_local_work_size)
+        if self.meta_information is None:
+            return False
+
+        orig_work_sizes = (self.orig_global_work_size, self.orig_local_work_size)
+        min_work_sizes = ((1,) * len(self.orig_global_work_size), (1,) * len(self.orig_local_work_size))
+
+        if checked == False or orig_work_sizes == min_work_sizes:
+            self.__rewrite_work_sizes(*min_work_sizes)
+            return orig_work_sizes != min_work_sizes
+
+        # Most test cases are still interesting with a single work item
+        index = self.__find_first([min_work_sizes, orig_work_sizes])
 
-        if checked == False:
-            self.__rewrite_work_sizes(new_global_work_size, new_local_work_size)
+        if index is None:
+            return False
+        elif index == 0:
+            self.__rewrite_work_sizes(*min_work_sizes)
             return True
 
-        while not self.test.check():
-            (new_global_work_size, new_local_work_size) = self.__update_work_sizes(new_global_work_size, new_local_work_size)
+        work_sizes = orig_work_sizes
 
-            if (new_global_work_size == self.orig_global_work_size and
-                new_local_work_size == self.orig_local_work_size):
-                return False
+        for dimension in range(0, len(self.orig_global_work_size)):
+            work_sizes = self.__search(self.get_global_candidates(work_sizes, dimension))
+            work_sizes = self.__search(self.get_local_candidates(work_sizes, dimension))
 
-        self.__rewrite_work_sizes(new_global_work_size, new_local_work_size)
+        self.__rewrite_work_sizes(*work_sizes)
 
-        return True
+        return work_sizes != orig_work_sizes
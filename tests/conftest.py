@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The scripts are not a package, they import each other by module name
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for path in [ROOT_DIR, os.path.join(ROOT_DIR, "scripts")]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
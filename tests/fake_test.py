@@ -0,0 +1,25 @@
+import threading
+
+from interestingness_tests import testcase
+
+class FakeInterestingnessTest:
+    # Stands in for an interestingness test class in the in-process passes
+    # (see speculation.CandidateTester). The verdict is decided by the
+    # is_interesting option which is called with the test case.
+    def __init__(self, test_cases, options):
+        self.test_cases = [testcase.TestCase.get(test_case) for test_case in test_cases]
+        self.options = options
+        self.stage_statistics = None
+        self.working_dir = None
+
+    def run_check(self):
+        with self.options["lock"]:
+            self.options["checks"].append(self.test_cases[0].get_content())
+
+        return self.options["is_interesting"](self.test_cases[0])
+
+    def cancel(self):
+        pass
+
+def create_test(test_case, is_interesting):
+    return FakeInterestingnessTest([test_case], {"is_interesting" : is_interesting, "checks" : [], "lock" : threading.Lock()})
@@ -0,0 +1,76 @@
+import json
+
+import dead_code_pruning
+from interestingness_tests import stream
+
+SOURCE = b"""int dead(void) { return 1; }
+int used(void) { return 2; }
+kernel void entry(global ulong *result) { result[0] = used(); }
+"""
+
+def get_node(kind, name, begin, end, file_name=None, included_from=None, inner=None):
+    # Declaration as dumped by Clang, which only prints the file of a
+    # location if it differs from the previous location
+    loc = {"offset" : begin, "line" : 1, "col" : 1, "tokLen" : 3}
+
+    if file_name is not None:
+        loc["file"] = file_name
+
+        if included_from is not None:
+            loc["includedFrom"] = {"file" : included_from}
+
+    node = {"id" : "0x{:x}".format(begin), "kind" : kind, "loc" : loc,
+            "range" : {"begin" : {"offset" : begin, "col" : 1, "tokLen" : 3}, "end" : {"offset" : end - 1, "col" : 1, "tokLen" : 1}},
+            "name" : name}
+
+    if inner is not None:
+        node["inner"] = inner
+
+    return node
+
+def get_main_node(kind, name, inner=None, file_name=None):
+    begin = SOURCE.index(" {}(".format(name).encode()) - len(kind == "FunctionDecl" and "int" or "kernel void")
+    end = SOURCE.index(b"}", begin) + 1
+
+    return get_node(kind, name, begin, end, file_name=file_name, inner=inner)
+
+def get_dump():
+    kernel_inner = [{"kind" : "OpenCLKernelAttr"}, {"kind" : "DeclRefExpr", "referencedDecl" : {"name" : "used"}}]
+    declarations = [
+        {"id" : "0x1", "kind" : "TypedefDecl", "loc" : {}, "range" : {"begin" : {}, "end" : {}}, "isImplicit" : True, "name" : "__int128_t"},
+        get_node("FunctionDecl", "get_global_id", 10, 30, "clc/clc.h", "test.cl"),
+        # Within the range of the test case but in the header
+        get_node("FunctionDecl", "get_local_id", 40, 50),
+        get_main_node("FunctionDecl", "dead", file_name="test.cl"),
+        get_main_node("FunctionDecl", "used"),
+        get_main_node("FunctionDecl", "entry", inner=kernel_inner),
+    ]
+    ast = {"id" : "0x0", "kind" : "TranslationUnitDecl", "loc" : {}, "range" : {"begin" : {}, "end" : {}}, "inner" : declarations}
+
+    return json.dumps(ast, indent=2).encode()
+
+def filter_dump(dump, chunk_size=7):
+    consumer = stream.MainFileASTFilter()
+
+    for offset in range(0, len(dump), chunk_size):
+        assert consumer.feed(dump[offset:offset + chunk_size])
+
+    return consumer.close()
+
+def test_keeps_declarations_of_main_file():
+    ast = filter_dump(get_dump())
+
+    assert [node["name"] for node in ast["inner"]] == ["dead", "used", "entry"]
+
+def test_truncated_dump_is_invalid():
+    dump = get_dump()
+
+    assert filter_dump(dump[:len(dump) // 2]) is None
+
+def test_removes_unreachable_declarations():
+    ast = filter_dump(get_dump(), chunk_size=64 * 1024)
+    declarations = dead_code_pruning.get_declarations(ast, len(SOURCE))
+    dead = dead_code_pruning.find_dead_declarations(declarations)
+
+    assert [declaration.names for declaration in dead] == [{"dead"}]
+    assert dead_code_pruning.remove_declarations(SOURCE, dead) == SOURCE[SOURCE.index(b"int used"):]
@@ -0,0 +1,63 @@
+import pytest
+
+import delta_reduction
+import fake_test
+
+CONTENT = """// -g 1,1,1 -l 1,1,1
+#define A 1
+struct S {
+    int a;
+};
+int unused(int x) {
+    return x + 1;
+}
+int g = 2;
+kernel void entry(global ulong *result) {
+    ulong x = 1;
+    ulong y = 2;
+    result[get_linear_global_id()] = x;
+}
+"""
+
+def write_test_case(tmp_path):
+    path = str(tmp_path / "test.cl")
+
+    with open(path, "w") as test_file:
+        test_file.write(CONTENT)
+
+    return path
+
+def is_interesting(test_case):
+    content = test_case.get_content()
+    return "entry" in content and "ulong x = 1;" in content and content.count("{") == content.count("}")
+
+def test_declarations():
+    declarations = delta_reduction.get_declarations(delta_reduction.get_lines(CONTENT.split("\n", 1)[1]))
+
+    assert declarations[0] == "#define A 1\n"
+    assert declarations[1] == "struct S {\n    int a;\n};\n"
+    assert declarations[3] == "int g = 2;\n"
+    assert declarations[4].startswith("kernel void entry") and declarations[4].endswith("}\n")
+    assert len(declarations) == 5
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_removes_irrelevant_parts(tmp_path, jobs):
+    path = write_test_case(tmp_path)
+    reducer = delta_reduction.DeltaReducer(path, fake_test.create_test(path, is_interesting), jobs)
+
+    assert reducer.run()
+
+    with open(path, "r") as test_file:
+        content = test_file.read()
+
+    # The header is kept and the result is 1-minimal with respect to lines
+    assert content == "// -g 1,1,1 -l 1,1,1\nkernel void entry(global ulong *result) {\n    ulong x = 1;\n}\n"
+
+def test_unchanged_if_nothing_can_be_removed(tmp_path):
+    path = write_test_case(tmp_path)
+    reducer = delta_reduction.DeltaReducer(path, fake_test.create_test(path, lambda test_case: test_case.get_content() == CONTENT))
+
+    assert not reducer.run()
+
+    with open(path, "r") as test_file:
+        assert test_file.read() == CONTENT
@@ -0,0 +1,17 @@
+from interestingness_tests import jsonl
+
+def test_appended_records_are_read_back(tmp_path):
+    path = str(tmp_path / "records.jsonl")
+    jsonl.append_record(path, {"index" : 0})
+    jsonl.append_record(path, {"index" : 1})
+
+    assert list(jsonl.read_records(path)) == [{"index" : 0}, {"index" : 1}]
+
+def test_incomplete_last_line_is_skipped(tmp_path):
+    path = str(tmp_path / "records.jsonl")
+    jsonl.append_record(path, {"index" : 0})
+
+    with open(path, "a") as records_file:
+        records_file.write("{\"index\" : 1")
+
+    assert list(jsonl.read_records(path)) == [{"index" : 0}]
@@ -0,0 +1,53 @@
+import time
+
+import manifest
+
+def write_file(path, content):
+    with open(path, "w") as output_file:
+        output_file.write(content)
+
+    return path
+
+def test_completed_stage_is_resumed(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    output = write_file(str(tmp_path / "a.pre.cl"), "kernel")
+    input_hash = manifest.get_hash(params={"stage" : "preprocess"})
+
+    manifest.Manifest(path).record("a", "preprocess", "ok", input_hash, output=output, start=time.monotonic())
+
+    resumed = manifest.Manifest(path)
+    resumed.load()
+    record = resumed.find("a", "preprocess", input_hash)
+
+    assert record["status"] == "ok"
+    assert record["output"] == output
+    # Other inputs or stages have to be run again
+    assert resumed.find("a", "preprocess", manifest.get_hash(params={"stage" : "other"})) is None
+    assert resumed.find("a", "reduce", input_hash) is None
+
+def test_changed_output_is_not_resumed(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    output = write_file(str(tmp_path / "a.red.cl"), "kernel")
+    input_hash = manifest.get_hash(output)
+
+    manifest.Manifest(path).record("a", "reduce", "ok", input_hash, output=output)
+    write_file(output, "changed")
+
+    resumed = manifest.Manifest(path)
+    resumed.load()
+
+    assert resumed.find("a", "reduce", input_hash) is None
+
+def test_last_record_wins_and_incomplete_line_is_skipped(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    first = manifest.Manifest(path)
+    first.record("a", "check", "failed", "hash", reason="not interesting")
+    first.record("a", "check", "failed", "hash", reason="timeout")
+
+    with open(path, "a") as manifest_file:
+        manifest_file.write("{\"test_case\" : \"a\"")
+
+    resumed = manifest.Manifest(path)
+    resumed.load()
+
+    assert resumed.find("a", "check", "hash")["reason"] == "timeout"
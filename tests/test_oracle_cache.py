@@ -0,0 +1,67 @@
+import os
+import stat
+import sys
+
+import interestingness_tests
+
+KERNEL = """// -g 1,1,1 -l 1,1,1
+kernel void entry(global ulong *result) {
+    result[get_linear_global_id()] = 1;
+}
+"""
+
+# Kills itself on its first run (e.g. like the out-of-memory killer)
+FAKE_OCLGRIND = """#!{python}
+import os, signal, sys
+marker = os.path.join(os.path.dirname(os.path.abspath(__file__)), "oclgrind.killed")
+if not os.path.exists(marker):
+    open(marker, "w").close()
+    os.kill(os.getpid(), signal.SIGKILL)
+print("1,2,3")
+"""
+
+FAKE_CL_LAUNCHER = """#!{python}
+print("1,2,4")
+"""
+
+def write_tool(directory, name, source):
+    path = os.path.join(str(directory), name)
+
+    with open(path, "w") as tool_file:
+        tool_file.write(source.format(python=sys.executable))
+
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
+
+def create_test(test_case, env):
+    test_class = interestingness_tests.WrongCodeBugOpenCLInterestingnessTest
+    return test_class([test_case], test_class.get_test_options(env))
+
+def test_killed_oracle_is_not_cached(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    write_tool(bin_dir, "oclgrind", FAKE_OCLGRIND)
+    cl_launcher = write_tool(bin_dir, "cl_launcher", FAKE_CL_LAUNCHER)
+
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ.get("PATH", ""))
+    monkeypatch.chdir(tmp_path)
+
+    test_case = tmp_path / "kernel.cl"
+    test_case.write_text(KERNEL)
+
+    env = {"CREDUCE_TEST_CL_LAUNCHER" : cl_launcher,
+           "CREDUCE_TEST_PLATFORM" : "0",
+           "CREDUCE_TEST_DEVICE" : "0",
+           "CREDUCE_TEST_CACHE" : str(tmp_path / "cache.sqlite"),
+           "CREDUCE_TEST_TIMEOUT" : "60"}
+
+    test = create_test(str(test_case), env)
+    assert test.get_exit_code() == -2
+    assert test.transient_failure
+
+    # Neither the oracle nor the verdict of the killed run may be reused
+    test = create_test(str(test_case), env)
+    assert test.get_exit_code() == 0
+    assert not test.transient_failure
+
+    assert create_test(str(test_case), env).get_exit_code() == 0
@@ -0,0 +1,54 @@
+from interestingness_tests import base
+
+def open_cache(tmp_path, max_size=None):
+    return base.PersistentCache(str(tmp_path / "cache.sqlite"), "verdicts", max_size)
+
+def get_keys(cache):
+    return {key for (key,) in cache.connection.execute("SELECT key FROM verdicts")}
+
+def test_size_includes_key_and_overhead(tmp_path):
+    cache = open_cache(tmp_path)
+    cache.put("a" * 40, 1)
+
+    assert cache.get_total_size() == 2 * 40 + len("1") + base.PersistentCache.row_overhead
+
+def test_replace_keeps_running_total(tmp_path):
+    cache = open_cache(tmp_path)
+    cache.put("key", "short")
+    cache.put("key", "a much longer value")
+    cache.put("other", 0)
+
+    (total_size,) = cache.connection.execute("SELECT TOTAL(size) FROM verdicts").fetchone()
+    assert cache.get_total_size() == total_size
+
+def test_evicts_least_recently_used_in_batches(tmp_path):
+    size = base.PersistentCache.get_size("key0", "0")
+    cache = open_cache(tmp_path, max_size=10 * size)
+
+    for index in range(10):
+        cache.put("key{}".format(index), index)
+
+    # Touched entries are kept
+    assert cache.get("key0") == 0
+    cache.put("key10", 10)
+
+    keys = get_keys(cache)
+    assert "key0" in keys
+    assert "key1" not in keys
+    assert "key10" in keys
+    # Eviction frees down to the low water mark
+    assert cache.get_total_size() <= 10 * size * base.PersistentCache.low_water_mark
+
+    # No eviction until the limit is crossed again
+    cache.put("key11", 11)
+    assert get_keys(cache) == keys | {"key11"}
+
+def test_total_is_shared_between_connections(tmp_path):
+    cache = open_cache(tmp_path)
+    cache.put("key", "value")
+
+    other_cache = open_cache(tmp_path)
+    other_cache.put("other", "value")
+
+    total_size = base.PersistentCache.get_size("key", "\"value\"") + base.PersistentCache.get_size("other", "\"value\"")
+    assert cache.get_total_size() == other_cache.get_total_size() == total_size
@@ -0,0 +1,41 @@
+from interestingness_tests import prefilter
+from interestingness_tests import testcase
+
+KERNEL = """// -g 1,1,1 -l 1,1,1
+size_t get_linear_global_id(void) {
+    return (get_global_id(2) * get_global_size(1) + get_global_id(1)) * get_global_size(0) + get_global_id(0);
+}
+
+kernel void entry(global ulong *result) {
+    result[get_linear_global_id()] = 1;
+}
+"""
+
+def find_problem(content, conservative=True):
+    return prefilter.find_problem(testcase.TestCase("test.cl", content.encode()), conservative)
+
+def test_valid_kernel():
+    assert find_problem(KERNEL) is None
+
+def test_missing_header():
+    assert find_problem(KERNEL.split("\n", 1)[1]) == "header"
+
+def test_unbalanced_brackets():
+    assert find_problem(KERNEL.replace("= 1;\n}", "= 1;\n")) == "brackets"
+    assert find_problem(KERNEL.replace("(void)", "(void]")) == "brackets"
+
+def test_missing_kernel_entry():
+    assert find_problem(KERNEL.replace("kernel void entry", "void entry")) == "kernel entry"
+    assert find_problem(KERNEL.replace("__kernel", "kernel").replace("kernel void entry", "__kernel void entry")) is None
+
+def test_conservative_checks():
+    changed_access = KERNEL.replace("result[get_linear_global_id()]", "result[0]")
+    changed_id = KERNEL.replace("get_global_id(0);", "0;")
+
+    assert find_problem(changed_access) == "result access"
+    assert find_problem(changed_id) == "get_linear_global_id"
+    assert find_problem(changed_access, conservative=False) is None
+    assert find_problem(changed_id, conservative=False) is None
+
+def test_brackets_in_comments_and_directives_are_ignored():
+    assert find_problem(KERNEL + "// )\n#define A (\n/* { */\n") is None
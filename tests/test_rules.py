@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from interestingness_tests import rules
+
+# Diagnostics which the static checks have always rejected
+CLANG_DIAGNOSTICS = [
+    "warning: empty struct is a GNU extension",
+    "warning: use of GNU empty initializer extension",
+    "warning: incompatible pointer to integer conversion",
+    "warning: incompatible integer to pointer conversion",
+    "warning: incompatible pointer types initializing",
+    "warning: comparison between pointer and integer",
+    "warning: ordered comparison between pointer and integer",
+    "warning: ordered comparison between pointer and zero",
+    "is uninitialized when used within its own initialization [-Wuninitialized]",
+    "is uninitialized when used here [-Wuninitialized]",
+    "may be uninitialized when used here [-Wconditional-uninitialized]",
+    "warning: use of GNU ?: conditional expression extension, omitting middle operand",
+    "warning: control may reach end of non-void function [-Wreturn-type]",
+    "warning: control reaches end of non-void function [-Wreturn-type]",
+    "warning: zero size arrays are an extension [-Wzero-length-array]",
+    "excess elements in ",
+    "warning: address of stack memory associated with local variable",
+    "warning: type specifier missing",
+    "warning: expected ';' at end of declaration list",
+    " declaration specifier [-Wduplicate-decl-specifier]",
+]
+
+CSA_DIAGNOSTICS = [
+    "warning: Assigned value is garbage or undefined",
+    "warning: Undefined or garbage value returned to caller",
+    "is a garbage value",
+    "warning: Function call argument is an uninitialized value",
+    "warning: Dereference of null pointer",
+    "warning: Array subscript is undefined",
+    "results in a dereference of a null pointer",
+]
+
+@pytest.mark.parametrize("category,diagnostic", [("ast", "PointerToIntegral")] +
+                                                [("clang", diagnostic) for diagnostic in CLANG_DIAGNOSTICS] +
+                                                [("csa", diagnostic) for diagnostic in CSA_DIAGNOSTICS])
+def test_default_rules_match_diagnostics(category, diagnostic):
+    output = "test.cl:3:5: note: unrelated\ntest.cl:4:1: {}\n".format(diagnostic)
+    rule = rules.get_rule_set().get_matcher([category]).find(output)
+
+    assert rule is not None and rule.category == category
+
+def test_clean_output_is_not_matched():
+    matcher = rules.get_rule_set().get_matcher(["ast", "clang", "csa"])
+
+    assert matcher.find("test.cl:4:1: warning: unused variable 'x' [-Wunused-variable]\n") is None
+    assert matcher.find("") is None
+
+def test_categories_are_separate():
+    assert rules.get_rule_set().get_matcher(["csa"]).find("warning: empty struct is a GNU extension") is None
+
+def test_custom_rules(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"clang" : [{"name" : "literal", "pattern" : "a.b"},
+                                           {"name" : "regex", "pattern" : "warning: [0-9]+ errors", "regex" : True}]}))
+    matcher = rules.get_rule_set(str(path)).get_matcher(["clang"])
+
+    # Literal patterns are escaped
+    assert matcher.find("axb") is None
+    assert str(matcher.find("a.b")) == "clang/literal"
+    assert str(matcher.find("warning: 12 errors")) == "clang/regex"
+    # The earliest match in the output wins
+    assert str(matcher.find("warning: 1 errors a.b")) == "clang/regex"
@@ -0,0 +1,48 @@
+import os
+
+import scheduling
+from interestingness_tests import telemetry
+
+def write_test_case(directory, name, global_work_size, size):
+    path = os.path.join(str(directory), name)
+    header = "// -g {} -l 1,1,1\n".format(global_work_size)
+
+    with open(path, "w") as test_file:
+        test_file.write(header + "x" * (size - len(header)))
+
+    return path
+
+def get_telemetry_path(test_case):
+    return test_case + ".telemetry.jsonl"
+
+def record_oracle(test_case, *durations):
+    for duration in durations:
+        event = {"tools" : [{"tool" : "oclgrind", "outcome" : "ok", "duration" : duration}, {"tool" : "clang", "outcome" : "ok", "duration" : 10.0}]}
+        telemetry.append_event(get_telemetry_path(test_case), event)
+
+def test_proxy_cost_orders_unmeasured_test_cases(tmp_path):
+    small = write_test_case(tmp_path, "small.cl", "1,1,1", 100)
+    wide = write_test_case(tmp_path, "wide.cl", "4,2,1", 100)
+    large = write_test_case(tmp_path, "large.cl", "1,1,1", 400)
+    missing = str(tmp_path / "missing.cl")
+
+    assert scheduling.get_work_items(wide) == 8
+    assert scheduling.sort_by_cost([wide, large, small, missing], get_telemetry_path) == [missing, small, large, wide]
+
+def test_measured_runtimes_take_precedence(tmp_path):
+    slow = write_test_case(tmp_path, "slow.cl", "1,1,1", 100)
+    fast = write_test_case(tmp_path, "fast.cl", "1,1,1", 200)
+    unmeasured = write_test_case(tmp_path, "unmeasured.cl", "1,1,1", 150)
+
+    # Only successful Oclgrind runs count
+    record_oracle(slow, 2.0, 4.0)
+    record_oracle(fast, 0.5)
+    telemetry.append_event(get_telemetry_path(fast), {"tools" : [{"tool" : "oclgrind", "outcome" : "timeout", "duration" : 100.0}]})
+
+    costs = scheduling.estimate_costs([slow, fast, unmeasured], get_telemetry_path)
+
+    assert costs[slow] == 3.0
+    assert costs[fast] == 0.5
+    # Scaled by the median ratio of runtime and proxy cost (0.0025 and 0.03)
+    assert abs(costs[unmeasured] - 150 * 0.03) < 1e-9
+    assert scheduling.sort_by_cost([slow, fast, unmeasured], get_telemetry_path) == [fast, slow, unmeasured]
@@ -0,0 +1,48 @@
+from interestingness_tests import stream
+
+CHUNK_SIZE = stream.OutputFingerprint.chunk_size
+
+def get_reference(data):
+    comparator = stream.StreamComparator()
+    comparator.feed(data)
+    return comparator.close()
+
+def feed_chunks(comparator, data):
+    # Returns the number of bytes fed until the comparator stopped the tool
+    for offset in range(0, len(data), CHUNK_SIZE):
+        if not comparator.feed(data[offset:offset + CHUNK_SIZE]):
+            return offset + CHUNK_SIZE
+
+    return len(data)
+
+def test_equal_outputs_have_equal_fingerprints():
+    data = b"0x1," * CHUNK_SIZE
+    fingerprint = get_reference(data)
+
+    assert fingerprint == stream.OutputFingerprint.from_bytes(data)
+    assert stream.get_divergence(fingerprint, get_reference(data)) == "match"
+
+def test_stops_once_result_data_diverged():
+    reference = get_reference(b"0x1," * CHUNK_SIZE)
+    comparator = stream.StreamComparator(lambda: reference, stop_on_divergence=True)
+
+    assert feed_chunks(comparator, b"0x2," * CHUNK_SIZE) == CHUNK_SIZE
+    assert comparator.result_diverged
+
+def test_does_not_stop_on_diverged_error_message():
+    # cl_launcher might still fail, e.g. after printing a build log
+    reference = get_reference(b"0x1," * CHUNK_SIZE)
+    comparator = stream.StreamComparator(lambda: reference, stop_on_divergence=True)
+    data = b"Error: build log\n" * CHUNK_SIZE
+
+    assert feed_chunks(comparator, data) == len(data)
+    assert comparator.diverged
+    assert not comparator.result_diverged
+    assert comparator.close() != reference
+
+def test_divergence_of_small_outputs():
+    reference = get_reference(b"0x1,0x2,0x3\n")
+
+    assert stream.get_divergence(get_reference(b"0x1,0x2,0x4\n"), reference) == "partial"
+    assert stream.get_divergence(get_reference(b"0x0,0x0,0x0\n"), reference) == "all"
+    assert stream.get_divergence(get_reference(b"0x1,0x2\n"), reference) == "length"
@@ -0,0 +1,31 @@
+from interestingness_tests import tokenizer
+
+def get_tokens(content):
+    return [token for (_, token) in tokenizer.tokenize(content)]
+
+def test_comments_and_whitespace_are_dropped():
+    assert get_tokens("int /* a */ x = 1; // b\n") == ["int", "x", "=", "1", ";"]
+
+def test_kinds():
+    tokens = list(tokenizer.tokenize("#define  A \\\n 1\nx += 0x1fUL * 1.5e-3f + \"s\";"))
+
+    assert tokens == [("directive", "#define A 1"), ("identifier", "x"), ("punctuator", "+="), ("number", "0x1fUL"),
+                      ("punctuator", "*"), ("number", "1.5e-3f"), ("punctuator", "+"), ("string", "\"s\""), ("punctuator", ";")]
+
+def test_longest_punctuator_wins():
+    assert get_tokens("a>>=b->c...d<<e") == ["a", ">>=", "b", "->", "c", "...", "d", "<<", "e"]
+
+def test_header():
+    content = "// Seed: 1 -g 4,1,1 -l 2,1,1\nkernel void entry() {}\n"
+
+    assert tokenizer.get_header(content) == "// Seed: 1 -g 4,1,1 -l 2,1,1"
+    assert tokenizer.get_header("kernel void entry() {}\n") == ""
+
+def test_normalised_hash_ignores_formatting():
+    content = "// -g 1,1,1 -l 1,1,1\nkernel void entry(global ulong *result) { result[0] = 1; }\n"
+    formatted = "// -g 1,1,1 -l 1,1,1\nkernel void entry(global ulong *result)\n{\n    // comment\n    result[0] = 1;\n}\n"
+
+    assert tokenizer.get_normalised_hash(content) == tokenizer.get_normalised_hash(formatted)
+    # The work sizes are part of the hash
+    assert tokenizer.get_normalised_hash(content) != tokenizer.get_normalised_hash(content.replace("-g 1,1,1", "-g 2,1,1"))
+    assert tokenizer.get_normalised_hash(content) != tokenizer.get_normalised_hash(content.replace("= 1", "= 2"))
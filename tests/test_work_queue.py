@@ -0,0 +1,78 @@
+import os
+import time
+
+import work_queue
+
+def open_queue(tmp_path, **kwargs):
+    return work_queue.WorkQueue(str(tmp_path / "queue.sqlite"), **kwargs)
+
+def expire_leases(queue):
+    queue.connection.execute("UPDATE jobs SET lease_expires = ? WHERE status = 'leased'", (time.time() - 1,))
+
+def test_expired_lease_is_handed_to_next_worker(tmp_path):
+    queue = open_queue(tmp_path, max_attempts=2)
+    queue.add("a.cl", "kernel")
+
+    assert queue.lease("crashed")["name"] == "a.cl"
+    assert queue.lease("other") is None
+
+    expire_leases(queue)
+
+    assert queue.lease("other")["name"] == "a.cl"
+    # Results of workers which have lost their lease are dropped
+    assert not queue.renew("a.cl", "crashed")
+    assert not queue.complete("a.cl", "crashed")
+    assert queue.complete("a.cl", "other", log="a.cl -> done\n")
+    assert queue.is_finished()
+
+def test_gives_up_after_max_attempts(tmp_path):
+    queue = open_queue(tmp_path, max_attempts=2)
+    queue.add("a.cl", "kernel")
+
+    for worker in ("first", "second"):
+        assert queue.lease(worker)["name"] == "a.cl"
+        expire_leases(queue)
+
+    assert queue.lease("third") is None
+    assert queue.is_finished()
+
+    (result,) = queue.get_results()
+    assert result["status"] == "failed"
+    assert "expired after 2 attempts" in result["log"]
+
+def test_results_are_fetched_once_in_completion_order(tmp_path):
+    queue = open_queue(tmp_path)
+
+    for name in ("a.cl", "b.cl", "c.cl"):
+        queue.add(name, "kernel")
+        queue.lease("worker")
+
+    queue.complete("b.cl", "worker", output_name="b.red.cl", output="reduced")
+    queue.complete("a.cl", "worker")
+    results = queue.get_results()
+
+    assert [result["name"] for result in results] == ["b.cl", "a.cl"]
+    assert results[0]["output"] == "reduced"
+
+    queue.complete("c.cl", "worker")
+
+    assert [result["name"] for result in queue.get_results(results[-1]["finished"])] == ["c.cl"]
+
+def test_rejects_names_outside_of_directory(tmp_path):
+    queue = open_queue(tmp_path)
+    directory = tmp_path / "worker"
+    directory.mkdir()
+
+    for name in ("../escape.cl", "sub/dir.cl", "..", "a.cl"):
+        queue.add(name, "kernel")
+
+    worker = work_queue.QueueWorker(queue, "worker", poll_interval=0)
+    paths = []
+
+    for path in worker.get_test_cases(str(directory)):
+        paths.append(path)
+        worker.complete(path)
+
+    assert paths == [os.path.join(str(directory), "a.cl")]
+    assert not (tmp_path / "escape.cl").exists()
+    assert {result["name"] : result["status"] for result in queue.get_results()} == {"../escape.cl" : "failed", "sub/dir.cl" : "failed", ".." : "failed", "a.cl" : "done"}
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+import fake_test
+import work_size_reduction
+
+CONTENT = "kernel void entry(global ulong *result) {\n}\n"
+
+def write_test_case(tmp_path, header="// -g 16,4,1 -l 4,2,1\n"):
+    path = str(tmp_path / "test.cl")
+
+    with open(path, "w") as test_file:
+        test_file.write(header + CONTENT)
+
+    return path
+
+def get_header(path):
+    with open(path, "r") as test_file:
+        return test_file.readline()
+
+def is_interesting(test_case):
+    (_, global_work_size, _, _) = test_case.get_work_sizes()
+    return global_work_size[0] >= 5 and global_work_size[1] >= 2
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_finds_smallest_interesting_work_sizes(tmp_path, jobs):
+    path = write_test_case(tmp_path)
+    reducer = work_size_reduction.WorkSizeReducer(path, fake_test.create_test(path, is_interesting), jobs)
+
+    assert reducer.run(checked=True)
+    assert get_header(path) == "// -g 5,2,1 -l 1,1,1\n"
+    # The copies of the candidates are removed
+    assert os.listdir(str(tmp_path)) == ["test.cl"]
+
+def test_single_work_item(tmp_path):
+    path = write_test_case(tmp_path)
+    test = fake_test.create_test(path, lambda test_case: True)
+
+    assert work_size_reduction.WorkSizeReducer(path, test).run(checked=True)
+    assert get_header(path) == "// -g 1,1,1 -l 1,1,1\n"
+    assert len(test.options["checks"]) == 1
+
+def test_uninteresting_test_case_is_unchanged(tmp_path):
+    path = write_test_case(tmp_path)
+
+    assert not work_size_reduction.WorkSizeReducer(path, fake_test.create_test(path, lambda test_case: False)).run(checked=True)
+    assert get_header(path) == "// -g 16,4,1 -l 4,2,1\n"
+
+def test_unchecked_reduction(tmp_path):
+    path = write_test_case(tmp_path)
+    test = fake_test.create_test(path, lambda test_case: False)
+
+    assert work_size_reduction.WorkSizeReducer(path, test).run(checked=False)
+    assert get_header(path) == "// -g 1,1,1 -l 1,1,1\n"
+    assert test.options["checks"] == []
+
+def test_missing_header(tmp_path):
+    path = write_test_case(tmp_path, header="")
+
+    assert not work_size_reduction.WorkSizeReducer(path, fake_test.create_test(path, is_interesting)).run(checked=True)